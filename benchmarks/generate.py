@@ -0,0 +1,77 @@
+"""Synthetic parameter files for the benchmarks
+
+Copyright 2018 iRobot Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from __future__ import absolute_import, print_function
+
+import yaml
+
+KEY_ID = 'alias/benchmark'
+
+INPUT_VALUES = {
+    'Env': 'prod',
+    'Owner': 'benchmarks',
+}
+
+def generate_file(index, count, encrypt):
+    """A parameter file with count parameters under its own base path, using .BASEPATH,
+    .COMMON, .INPUTS, $(Var) references, StringLists, and SecureStrings that are
+    encrypted directly or through an encrypted input."""
+    data = {
+        '.BASEPATH': '/bench/$(Env)/service{:04d}'.format(index),
+        '.COMMON': {
+            'Description': 'Benchmark parameter owned by $(Owner)',
+        },
+        '.INPUTS': {
+            'Env': 'String',
+            'Owner': {'Type': 'String', 'Pattern': '^[a-z]+$'},
+            'ApiKey': 'String',
+        },
+    }
+    for i in range(count):
+        # Parameters are keyed by their name within the file when files are merged,
+        # so names have to be unique across files, not just base paths
+        name = 'group{:02d}/param{:04d}-{:05d}'.format(i % 20, index, i)
+        if i % 50 == 0:
+            data[name] = {
+                'Type': 'SecureString',
+                'KeyId': KEY_ID,
+                'EncryptedValue': '$(ApiKey)',
+            }
+        elif i % 20 == 0:
+            data[name] = {
+                'Type': 'SecureString',
+                'KeyId': KEY_ID,
+                'EncryptedValue': encrypt('secret-{}-{}'.format(index, i)),
+            }
+        elif i % 10 == 0:
+            data[name] = ['a{}'.format(i), 'b{}'.format(i), '$(Env)']
+        elif i % 3 == 0:
+            data[name] = 'https://$(Env).example.com/service{}/{}'.format(index, i)
+        else:
+            data[name] = 'value-{}-{}'.format(index, i)
+    return yaml.safe_dump(data, default_flow_style=False)
+
+def generate_files(total, encrypt, per_file=1000):
+    """A dict of file name to parameter file text, with total parameters in all"""
+    files = {}
+    index = 0
+    while total > 0:
+        count = min(per_file, total)
+        files['service{:04d}.yaml'.format(index)] = generate_file(index, count, encrypt)
+        total -= count
+        index += 1
+    return files
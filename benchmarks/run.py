@@ -0,0 +1,200 @@
+"""Benchmarks for loading, resolving, diffing, and deploying parameter files
+
+Copyright 2018 iRobot Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Usage:
+    python benchmarks/run.py [--scales 1000,10000,100000] [--repeat N] [--output FILE]
+                             [--latency SECONDS] [--compare BASELINE_FILE [--threshold RATIO]]
+
+Synthetic parameter files are generated for each scale (the total number of parameters),
+and each step is timed against the in-memory backend in ssm_ctl.fake. The results are
+written as JSON. With --compare, the median of each step is compared against a previous
+result file, and the exit code is 1 if any step is slower by more than the threshold ratio.
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import six
+
+import ssm_ctl
+from ssm_ctl.ssm import SSMClient
+from ssm_ctl.fake import FakeBackend
+from ssm_ctl.files import Input, load_parameter_files, compile_parameter_file
+from ssm_ctl.parameters import SSMParameter
+from ssm_ctl.util import VarString
+
+from generate import generate_files, INPUT_VALUES
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+STEPS = ['load_parameter_files', 'resolve', 'get_value', 'compile_parameter_file', 'diff_paths', 'batch_put']
+
+def reset():
+    """Reset the class-level state that loading parameter files leaves behind"""
+    VarString.NAMES.clear()
+    VarString._VAR_VALUES.clear()
+
+class _Quiet(object):
+    """Discard stdout (load_parameter_files prints each file name)"""
+    def __enter__(self):
+        self._stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def __exit__(self, *args):
+        sys.stdout.close()
+        sys.stdout = self._stdout
+
+def run_once(files, api_key, latency=0, concurrency=None):
+    """Run each step once, returning a dict of step name to seconds"""
+    reset()
+    backend = FakeBackend(latency=latency)
+    uninstall = backend.install(SSMClient)
+    times = {}
+    try:
+        start = _clock()
+        with _Quiet():
+            inputs, parameters, base_paths = load_parameter_files(files)
+        times['load_parameter_files'] = _clock() - start
+
+        for name, value in six.iteritems(INPUT_VALUES):
+            inputs[name].set_value(value)
+        inputs['ApiKey'].set_value(api_key)
+
+        start = _clock()
+        VarString.resolve(Input.get_resolver(inputs, prompt=False))
+        times['resolve'] = _clock() - start
+
+        start = _clock()
+        for parameter in six.itervalues(parameters):
+            parameter.get_value()
+        times['get_value'] = _clock() - start
+
+        start = _clock()
+        compile_parameter_file(six.itervalues(parameters))
+        times['compile_parameter_file'] = _clock() - start
+
+        # Half of the parameters already exist, plus some that would be removed
+        names = SSMParameter.get_names(six.itervalues(parameters))
+        base_paths = [VarString.dump(p) for p in base_paths]
+        for name in names[::2]:
+            backend.ssm.put_parameter(Name=name, Value='old', Type='String')
+        for base_path in base_paths:
+            backend.ssm.put_parameter(Name=base_path + '/stale', Value='old', Type='String')
+
+        start = _clock()
+        SSMClient.diff_paths(base_paths, names)
+        times['diff_paths'] = _clock() - start
+
+        start = _clock()
+        results = SSMClient.batch_put(six.itervalues(parameters), dumper=SSMParameter.ssm_client_dumper,
+                                      concurrency=concurrency)
+        times['batch_put'] = _clock() - start
+        errors = [r for r in results if r.error]
+        if errors:
+            raise RuntimeError("{} puts failed, e.g. {}: {}".format(len(errors), errors[0].name, errors[0].error))
+    finally:
+        uninstall()
+        reset()
+    return times
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+def run(scales, repeat, latency=0, concurrency=None, log=None):
+    SSMParameter.OVERWRITE_DEFAULT = True
+    results = []
+    for scale in scales:
+        backend = FakeBackend()
+        files = generate_files(scale, lambda plaintext: backend.kms.encrypt(plaintext, 'alias/benchmark'))
+        api_key = backend.kms.encrypt('api-key', 'alias/benchmark')
+        runs = [run_once(files, api_key, latency=latency, concurrency=concurrency) for _ in range(repeat)]
+        for step in STEPS:
+            seconds = [times[step] for times in runs]
+            result = {
+                'scale': scale,
+                'step': step,
+                'seconds': seconds,
+                'min': min(seconds),
+                'median': _median(seconds),
+            }
+            results.append(result)
+            if log:
+                log('{:>7} {:<24} median {:.4f}s  min {:.4f}s'.format(scale, step, result['median'], result['min']))
+    return {
+        'version': ssm_ctl.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.time(),
+        'repeat': repeat,
+        'latency': latency,
+        'results': results,
+    }
+
+def compare(data, baseline, threshold, log):
+    """Log the ratio of each step's median to the baseline's; returns the regressed steps"""
+    baseline_results = dict(((r['scale'], r['step']), r) for r in baseline['results'])
+    regressions = []
+    for result in data['results']:
+        key = (result['scale'], result['step'])
+        if key not in baseline_results or not baseline_results[key]['median']:
+            continue
+        ratio = result['median'] / baseline_results[key]['median']
+        flag = ''
+        if ratio > threshold:
+            regressions.append(key)
+            flag = '  REGRESSION'
+        log('{:>7} {:<24} {:.2f}x{}'.format(result['scale'], result['step'], ratio, flag))
+    return regressions
+
+def main(args=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', type=lambda s: [int(v) for v in s.split(',')], default=[1000, 10000, 100000],
+                        help='Comma-separated numbers of parameters')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0, help='Seconds of latency for each fake SSM call')
+    parser.add_argument('--concurrency', type=int, help='Number of parallel PutParameter calls')
+    parser.add_argument('--output', '-o', type=argparse.FileType('w'), help='Write the results to this file (default stdout)')
+    parser.add_argument('--compare', type=argparse.FileType('r'), help='A previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25, help='Slowdown ratio that counts as a regression')
+
+    args = parser.parse_args(args=args)
+
+    log = lambda message: sys.stderr.write(message + '\n')
+
+    data = run(args.scales, args.repeat, latency=args.latency, concurrency=args.concurrency, log=log)
+
+    output = args.output or sys.stdout
+    json.dump(data, output, indent=2, sort_keys=True)
+    output.write('\n')
+
+    if args.compare:
+        if compare(data, json.load(args.compare), args.threshold, log):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,370 @@
+"""asyncio interface to SSM Parameter Store (Python 3.5+)
+
+Copyright 2018 iRobot Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from __future__ import absolute_import, print_function
+
+import asyncio
+import functools
+import inspect
+import threading
+
+from . import util
+from .ssm import SSMClient, PutResult, _CallAttempts, clientmethod
+from .rate import TokenBucket, AdaptiveRateLimiter
+from .pathindex import PathIndex, REMOTE
+
+class ExecutorClient(object):
+    """Wraps a synchronous boto3-like client so that its operations are coroutines,
+    run in the given executor (default: the event loop's default executor)."""
+
+    def __init__(self, client, executor=None):
+        self._sync_client = client
+        self._executor = executor
+
+    def __getattr__(self, name):
+        method = getattr(self._sync_client, name)
+
+        async def call(**kwargs):
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(method, **kwargs))
+        return call
+
+def _start_loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name='ssm-ctl-aio')
+    thread.daemon = True
+    thread.start()
+    return loop
+
+class SyncClient(object):
+    """A synchronous boto3-like client whose operations are run by the async client of
+    an AsyncSSMClient, for use as SSMClient's client (see AsyncSSMClient.sync_client()).
+    Operations are run on the given event loop, or on a private event loop in a background
+    thread. They block until done, so they must not be called from the loop's own thread."""
+
+    def __init__(self, async_client, loop=None):
+        self._async_client = async_client
+        self._loop = loop or _start_loop()
+
+    def __getattr__(self, name):
+        def call(**kwargs):
+            future = asyncio.run_coroutine_threadsafe(
+                self._async_client._raw_call(name, **kwargs), self._loop)
+            return future.result()
+        return call
+
+class AsyncSSMClient(object):
+    """Client for SSM Parameter store with coroutine methods, built on an async client
+    (an object whose SSM operations are coroutines, like an aiobotocore client).
+    :param client: The async client. If not given, one is created with CLIENT_FACTORY.
+    :param concurrency: The maximum number of calls in flight (default CONCURRENCY).
+    :param ssm_client: The SSMClient used for encryption and reencrypt keys
+        (default SSMClient.default()). Its crypto is run in the loop's default executor.
+
+    All calls draw from one AdaptiveRateLimiter and are retried with backoff when throttled
+    or on transient errors, as with SSMClient. An instance must only be used from one event loop.
+
+    As with SSMClient, SESSION_FACTORY and CLIENT_FACTORY can be set on the class or on an
+    instance, and are called as SESSION_FACTORY() and CLIENT_FACTORY(session, name);
+    CLIENT_FACTORY may return the client or an awaitable of it. Only the built-in defaults
+    (an aiobotocore session and client) are bound to the client.
+    """
+
+    THROTTLE_ERROR_CODES = SSMClient.THROTTLE_ERROR_CODES
+    TRANSIENT_ERROR_CODES = SSMClient.TRANSIENT_ERROR_CODES
+    MAX_ATTEMPTS = SSMClient.MAX_ATTEMPTS
+    MAX_BACKOFF = SSMClient.MAX_BACKOFF
+
+    CONCURRENCY = 64
+
+    def __init__(self, client=None, region_name=None, profile_name=None, concurrency=None, ssm_client=None):
+        self.region_name = region_name
+        self.profile_name = profile_name
+        self.concurrency = concurrency or self.CONCURRENCY
+        self.ssm_client = ssm_client
+
+        self._ssm_client = client
+        self._session = None
+        self._client_context = None
+        self._client_lock = None
+        self._semaphore = None
+        self._rate_limiter = AdaptiveRateLimiter()
+
+    @clientmethod
+    def _default_session_factory(self):
+        """Default session factory that creates an aiobotocore session."""
+        from aiobotocore.session import AioSession
+        return AioSession(profile=self.profile_name)
+
+    @clientmethod
+    async def _default_client_factory(self, session, name):
+        """Default client factory that creates an aiobotocore client from the session.
+        botocore's own retries are turned off; throttles and transient errors are retried by _call()."""
+        from botocore.config import Config
+        self._client_context = session.create_client(name,
+            region_name=self.region_name,
+            config=Config(retries={'max_attempts': 0}))
+        return await self._client_context.__aenter__()
+
+    SESSION_FACTORY = _default_session_factory
+    CLIENT_FACTORY = _default_client_factory
+
+    _hook = SSMClient.__dict__['_hook']
+
+    async def _client(self):
+        """Use the defined session and client factories to create the async client."""
+        if self._ssm_client is None:
+            if self._client_lock is None:
+                self._client_lock = asyncio.Lock()
+            async with self._client_lock:
+                if self._ssm_client is None:
+                    if self._session is None:
+                        self._session = self._hook('SESSION_FACTORY')()
+                    client = self._hook('CLIENT_FACTORY')(self._session, "ssm")
+                    if inspect.isawaitable(client):
+                        client = await client
+                    self._ssm_client = client
+        return self._ssm_client
+
+    async def close(self):
+        """Close the async client, if it was created by the default client factory"""
+        if self._client_context is not None:
+            await self._client_context.__aexit__(None, None, None)
+            self._client_context = None
+            self._ssm_client = None
+
+    def rate_limiter(self):
+        """The AdaptiveRateLimiter that all SSM API calls from this client draw from."""
+        return self._rate_limiter
+
+    def _crypto(self):
+        return self.ssm_client or SSMClient.default()
+
+    _is_throttle = SSMClient.__dict__['_is_throttle']
+    _is_transient = SSMClient.__dict__['_is_transient']
+
+    async def _raw_call(self, operation, **kwargs):
+        client = await self._client()
+        return await getattr(client, operation)(**kwargs)
+
+    async def _call(self, operation, **kwargs):
+        """Call the given operation on the async client through the rate limiter,
+        with at most concurrency calls in flight, retrying with backoff when throttled
+        or on transient errors (see SSMClient._call())."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        limiter = self._rate_limiter
+        attempts = _CallAttempts(self, limiter, SSMClient.STATS, operation, kwargs)
+        while True:
+            async with self._semaphore:
+                wait = limiter.reserve()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                try:
+                    response = await self._raw_call(operation, **kwargs)
+                except Exception as e:
+                    delay = attempts.retry_delay(e)
+                    if delay is None:
+                        raise
+                else:
+                    attempts.succeeded(response)
+                    return response
+            await asyncio.sleep(delay)
+
+    async def _paginate(self, operation, **kwargs):
+        """Get all the pages of the given operation, in order"""
+        responses = []
+        while True:
+            response = await self._call(operation, **kwargs)
+            responses.append(response)
+            next_token = response.get('NextToken')
+            if not next_token:
+                return responses
+            kwargs['NextToken'] = next_token
+
+    async def _load_parameters_from_response(self, response, loader, reencrypt, base_path=None):
+        if not loader:
+            loader = lambda o, base_path: o
+        crypto = self._crypto()
+        loop = asyncio.get_event_loop()
+
+        async def load(item):
+            # Encrypted SecureStrings aren't in AWS Encryption SDK format, so reencrypt them with it
+            if reencrypt and item['Type'] == 'SecureString':
+                key_id = crypto._get_reencrypt_key(item['Name'], item['KeyId'])
+                item['EncryptedValue'] = await loop.run_in_executor(None,
+                    crypto.encrypt, item.pop('Value'), key_id)
+            return loader(item, base_path)
+
+        return list(await asyncio.gather(*[load(item) for item in response['Parameters']]))
+
+    async def _get_full_batch(self, name_batch, decrypt):
+        """Get the latest value and attributes of up to 10 parameters (see SSMClient._get_full_batch).
+        This needs ssm:DescribeParameters."""
+        response, describe_responses = await asyncio.gather(
+            self._call('get_parameters',
+                Names=name_batch,
+                WithDecryption=decrypt),
+            self._paginate('describe_parameters',
+                ParameterFilters=[{
+                    'Key': 'Name',
+                    'Option': 'Equals',
+                    'Values': name_batch,
+                }]))
+        described_items = [item for describe_response in describe_responses for item in describe_response['Parameters']]
+        return SSMClient._merge_attributes(response['Parameters'], described_items), response['InvalidParameters']
+
+    async def _get_described(self, described_items, decrypt):
+        """Get the values of parameters already listed by DescribeParameters, with all batches
+        of 10 in flight at once (see SSMClient._get_described())"""
+        responses = await asyncio.gather(*[
+            self._call('get_parameters',
+                Names=[item['Name'] for item in item_batch],
+                WithDecryption=decrypt)
+            for item_batch in util.batch(described_items, 10)])
+        items = [item for response in responses for item in response['Parameters']]
+        return SSMClient._merge_described(items, described_items)
+
+    async def get(self, names, full=False, reencrypt=True, loader=None, base_path=None):
+        """Get the specified parameter(s), with all batches of 10 in flight at once.
+        :param full: When False, get only the name, type, and value.
+            When True, also get the parameter attributes (description, allowed pattern, key id, etc.)
+        """
+        if isinstance(names, str):
+            names = [names]
+
+        async def get_batch(name_batch):
+            if full:
+                return await self._get_full_batch(name_batch, reencrypt)
+            response = await self._call('get_parameters',
+                Names=name_batch,
+                WithDecryption=reencrypt)
+            return response['Parameters'], response['InvalidParameters']
+
+        batches = await asyncio.gather(*[get_batch(name_batch) for name_batch in util.batch(list(names), 10)])
+
+        invalid_parameter_names = []
+        items = []
+        for batch_items, invalid_names in batches:
+            invalid_parameter_names.extend(invalid_names)
+            items.extend(batch_items)
+        if invalid_parameter_names:
+            raise KeyError("Invalid parameter names {}".format(', '.join(invalid_parameter_names)))
+        return await self._load_parameters_from_response({'Parameters': items}, loader, reencrypt=reencrypt, base_path=base_path)
+
+    async def list_path(self, path, recursive=True, parameter_filters=[]):
+        """List the parameters on the given path as ParameterMetadata tuples, using
+        GetParametersByPath without decryption (see SSMClient.list_path())"""
+        responses = await self._paginate('get_parameters_by_path',
+            Path=path,
+            Recursive=recursive,
+            ParameterFilters=parameter_filters,
+            WithDecryption=False,
+            MaxResults=10)
+        return SSMClient._metadata([item for response in responses for item in response['Parameters']])
+
+    async def get_path(self, path, names_only=False, full=False, reencrypt=True, loader=None, recursive=True, parameter_filters=[]):
+        """Get the parameters on the path. With full, the pages of DescribeParameters are
+        merged with the values from GetParameters, which needs ssm:DescribeParameters."""
+        if names_only and full:
+            raise ValueError("Can't specify both names_only and full")
+
+        if names_only:
+            metadata = await self.list_path(path, recursive=recursive, parameter_filters=parameter_filters)
+            return [m.name for m in metadata]
+
+        if full:
+            responses = await self._paginate('describe_parameters',
+                ParameterFilters=SSMClient._path_filters(path, recursive, parameter_filters),
+                MaxResults=50)
+            items = await self._get_described(
+                [item for response in responses for item in response['Parameters']], reencrypt)
+        else:
+            responses = await self._paginate('get_parameters_by_path',
+                Path=path,
+                Recursive=recursive,
+                ParameterFilters=parameter_filters,
+                WithDecryption=reencrypt)
+            items = [item for response in responses for item in response['Parameters']]
+        return await self._load_parameters_from_response({'Parameters': items}, loader, reencrypt=reencrypt, base_path=path)
+
+    async def list_paths(self, paths, recursive=True, parameter_filters=[]):
+        """List multiple paths at once (see SSMClient.list_paths).
+        Returns a dict of path to the list of ParameterMetadata on that path."""
+        paths = list(paths)
+        list_paths = util.covering_paths(paths) if recursive else paths
+        results = await asyncio.gather(*[
+            self.list_path(path, recursive=recursive, parameter_filters=parameter_filters)
+            for path in list_paths])
+        return util.assign_listings(paths, dict(zip(list_paths, results)))
+
+    async def diff_paths(self, paths, names):
+        """Diff the names against the parameters on the paths, returning a PathDiff.
+        Names that are not on any of the paths are always in the add list."""
+        index = PathIndex(local=names)
+        listings = await self.list_paths(util.covering_paths(paths))
+        for metadata in listings.values():
+            for m in metadata:
+                index.add(m.name, REMOTE)
+        return index.diff()
+
+    async def batch_put(self, parameters, dumper=None, rate=None):
+        """Store the given parameters in SSM, with up to concurrency puts in flight,
+        limited to rate calls per second (default SSMClient.PUT_RATE, None for unlimited).
+        Returns a list of PutResults in the order of the parameters (see SSMClient.batch_put)."""
+        if not dumper:
+            dumper = lambda o: o
+        if rate is None:
+            rate = SSMClient.PUT_RATE
+        # No burst, so the first second doesn't get up to twice the rate
+        bucket = TokenBucket(rate, capacity=1)
+
+        async def put(parameter):
+            kwargs = dumper(parameter)
+            if not kwargs:
+                return None
+            wait = bucket.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                response = await self._call('put_parameter',
+                    **kwargs
+                    )
+            except Exception as e:
+                return PutResult(kwargs['Name'], None, e)
+            return PutResult(kwargs['Name'], response, None)
+
+        results = await asyncio.gather(*[put(parameter) for parameter in parameters])
+        return [result for result in results if result is not None]
+
+    async def delete(self, names):
+        if isinstance(names, str):
+            names = [names]
+        return list(await asyncio.gather(*[
+            self._call('delete_parameters', Names=name_batch)
+            for name_batch in util.batch(list(names), 10)]))
+
+    def sync_client(self, loop=None, session=None):
+        """Get an SSMClient whose SSM calls are made with this client's async client.
+        :param loop: The event loop this client is used on. If not given, calls are run on
+            a private event loop in a background thread, so this client must not be used
+            on any other loop.
+        :param session: The session for the SSMClient's other calls (e.g., for the account);
+            it isn't used for SSM calls, and is only created if needed.
+        The SSMClient must not be called from the loop's own thread."""
+        return SSMClient(region_name=self.region_name, profile_name=self.profile_name, session=session,
+                         client=SyncClient(self, loop=loop))
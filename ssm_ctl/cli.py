@@ -27,9 +27,17 @@ import re
 
 import yaml
 
-from .ssm import SSMClient
+from . import util
+from . import stats
+from . import trace
+from . import profiling
+from .ssm import SSMClient, DecryptCache
+from .pathindex import REMOTE
+from .snapshot import SnapshotCache
+from .filecache import ParameterFileCache
 from .parameters import SSMParameter
-from .files import Input, load_parameters, compile_parameter_file
+from .files import Input, load_parameters, compile_parameter_file, decrypt_values, DECRYPT_CONCURRENCY, load_yaml, PARALLEL_PARSE_MIN_FILES
+from .util import VarString
 
 def add_common_args(parser, defaults):
     verbose_group = parser.add_mutually_exclusive_group()
@@ -68,13 +76,183 @@ def add_prompt_args(parser, defaults):
     prompt_group.add_argument('--no-prompt', action='store_false', dest='prompt')
     defaults['prompt'] = True
 
-def flush(paths, names):
+def flush(paths, names, index=None, client=SSMClient, log=six.print_):
+    if index is None:
+        index = client.index_paths(paths, names)
     for path in paths:
-        six.print_("Flushing base path {}...".format(path))
-        diff = SSMClient.diff_path(path, names)
-        SSMClient.delete(diff.remove)
+        log("Flushing base path {}...".format(path))
+        with trace.span('flush', path=path):
+            diff = index.diff(path)
+            client.delete(diff.remove)
+            for name in diff.remove:
+                index.discard(name, REMOTE)
 
-def print_diff(diff):
+def add_snapshot_args(parser):
+    snapshot_group = parser.add_argument_group()
+    snapshot_group.add_argument('--snapshot-cache', action='store_true', help='Keep snapshots of the base paths on disk')
+    snapshot_group.add_argument('--snapshot-max-age', type=float, help='Use snapshots younger than this many seconds without revalidating them')
+
+def configure_snapshot_cache(args):
+    if args.snapshot_cache:
+        SSMClient.SNAPSHOT_CACHE = SnapshotCache(trust_age=args.snapshot_max_age)
+
+def add_crypto_args(parser):
+    crypto_group = parser.add_argument_group()
+    crypto_group.add_argument('--data-key-cache-max-age', type=float,
+                              help='Cache Encryption SDK data keys, reusing each for up to this many seconds')
+    crypto_group.add_argument('--data-key-cache-max-messages', type=int,
+                              help='Replace a cached data key after it has encrypted this many values')
+    crypto_group.add_argument('--data-key-cache-max-bytes', type=int,
+                              help='Replace a cached data key after it has encrypted this many bytes')
+    crypto_group.add_argument('--data-key-cache-capacity', type=int, help='Number of data keys to cache')
+
+def configure_crypto(args, client=SSMClient):
+    if args.data_key_cache_max_age is not None:
+        client.set_data_key_cache(args.data_key_cache_max_age,
+            max_messages=args.data_key_cache_max_messages,
+            max_bytes=args.data_key_cache_max_bytes,
+            capacity=args.data_key_cache_capacity)
+
+def add_stats_args(parser):
+    stats_group = parser.add_argument_group('stats')
+    stats_group.add_argument('--stats', action='store_true',
+                             help='Print the calls, retries, throttles, latency, and bytes of each operation')
+    stats_group.add_argument('--stats-json', metavar='FILE', help='Write the stats as JSON to this file')
+    stats_group.add_argument('--stats-statsd', metavar='HOST[:PORT]', help='Send the stats to StatsD over UDP')
+    stats_group.add_argument('--stats-prometheus', metavar='FILE',
+                             help='Write the stats to this Prometheus textfile collector file')
+
+def get_stats_sinks(args):
+    sinks = []
+    if args.stats:
+        sinks.append(stats.SummarySink(sys.stderr))
+    if args.stats_json:
+        sinks.append(stats.JsonSink(args.stats_json))
+    if args.stats_statsd:
+        sinks.append(stats.StatsDSink.from_string(args.stats_statsd))
+    if args.stats_prometheus:
+        sinks.append(stats.PrometheusTextfileSink(args.stats_prometheus))
+    return sinks
+
+def emit_stats(sinks, client=SSMClient):
+    for sink in sinks:
+        try:
+            sink.emit(client.STATS)
+        except Exception as e:
+            sys.stderr.write('Failed to emit stats with {}: {}\n'.format(type(sink).__name__, e))
+
+def add_trace_args(parser):
+    trace_group = parser.add_argument_group('trace')
+    trace_group.add_argument('--trace', metavar='FILE',
+                             help='Write timing spans of each phase to this file as Chrome trace events')
+
+def add_profile_args(parser):
+    profile_group = parser.add_argument_group('profile')
+    profile_group.add_argument('--profile', nargs='?', const='', metavar='FILE',
+                               help='Profile the command, writing the profile to FILE (use --profile=FILE; '
+                                    'default ssm-ctl-COMMAND.pstats or .collapsed) and printing the top functions')
+    profile_group.add_argument('--profile-mode', choices=profiling.MODES, default=profiling.DETERMINISTIC,
+                               help='deterministic: cProfile of every thread, saved as pstats; '
+                                    'sampling: stack samples of every thread, saved as collapsed stacks')
+    profile_group.add_argument('--profile-top', type=int, default=profiling.TOP, metavar='N',
+                               help='Number of functions to print')
+
+def add_global_args(parser):
+    add_stats_args(parser)
+    add_trace_args(parser)
+    add_profile_args(parser)
+
+def _split_profile_arg(args):
+    """A bare --profile would take the next argument (often a file or path) as its FILE,
+    so rewrite it as --profile= to require FILE to be given as --profile=FILE"""
+    if '--' in args:
+        index = args.index('--')
+        return _split_profile_arg(args[:index]) + args[index:]
+    return ['--profile=' if arg == '--profile' else arg for arg in args]
+
+def get_snapshots(paths, client=SSMClient):
+    if client.SNAPSHOT_CACHE is None:
+        return []
+    return [client.get_snapshot(path) for path in util.covering_paths(paths)]
+
+def _find_snapshot(snapshots, name):
+    for snapshot in snapshots:
+        if util.is_subpath(name, snapshot.path):
+            return snapshot
+    return None
+
+def changed_parameters(parameters, concurrency=None, snapshots=(), client=SSMClient):
+    """Filter the parameters to the ones that differ from their current state.
+    Parameters whose content hash matches the snapshot entry for an unchanged remote
+    version are skipped without being fetched."""
+    salt = SSMClient.SNAPSHOT_CACHE.salt if snapshots else ''
+    to_fetch = []
+    for parameter in parameters:
+        snapshot = _find_snapshot(snapshots, parameter.get_name())
+        entry = snapshot.entries.get(parameter.get_name()) if snapshot else None
+        if entry and entry.value_hash and entry.value_hash == SSMParameter.content_hash(SSMParameter.ssm_client_dumper(parameter), salt):
+            continue
+        to_fetch.append(parameter)
+    
+    current = client.get_current([p.get_name() for p in to_fetch], concurrency=concurrency)
+    changed = []
+    for parameter in to_fetch:
+        item = current.get(parameter.get_name())
+        if parameter.differs_from(item):
+            changed.append(parameter)
+            continue
+        snapshot = _find_snapshot(snapshots, parameter.get_name())
+        if snapshot:
+            snapshot.set_hash(item['Name'], item['Version'], SSMParameter.content_hash(item, salt), type=item['Type'])
+    return changed
+
+def record_puts(snapshots, parameters, results):
+    """Record the name, version, type, and content hash of each successful put in the
+    snapshot that covers it"""
+    if not snapshots:
+        return
+    salt = SSMClient.SNAPSHOT_CACHE.salt
+    parameters = dict((p.get_name(), p) for p in parameters)
+    for result in results:
+        snapshot = _find_snapshot(snapshots, result.name)
+        if result.error or not snapshot:
+            continue
+        parameter = parameters[result.name]
+        data = SSMParameter.ssm_client_dumper(parameter)
+        snapshot.set_hash(result.name, result.response.get('Version'), SSMParameter.content_hash(data, salt), type=parameter.type)
+
+def report_rate(client=SSMClient, prefix=''):
+    limiter = client.rate_limiter()
+    if not limiter.calls:
+        return
+    if limiter.throttles:
+        message = 'SSM request rate settled at {:.1f} calls/s ({} calls, {} throttled)'.format(
+            limiter.rate, limiter.calls, limiter.throttles)
+    else:
+        message = 'SSM request rate was not throttled ({} calls)'.format(limiter.calls)
+    sys.stderr.write('{}{}\n'.format(prefix, message))
+
+def report_crypto(client=SSMClient, prefix=''):
+    """Report the crypto calls recorded in the client's STATS"""
+    if client.STATS is None:
+        return
+    for (category, operation), op in client.STATS.items():
+        if category != 'crypto':
+            continue
+        message = '{} calls: {}, mean {:.1f} ms, max {:.1f} ms'.format(
+            operation.capitalize(), op.calls, op.total_time / op.calls * 1000, op.max_time * 1000)
+        if op.errors:
+            message += ', {} failed'.format(op.errors)
+        sys.stderr.write('{}{}\n'.format(prefix, message))
+
+def report_decrypt_cache(cache=None):
+    if cache is None:
+        cache = SSMClient.DECRYPT_CACHE
+    if cache is None or not (cache.hits or cache.misses):
+        return
+    sys.stderr.write('Decrypt cache: {} hits, {} misses\n'.format(cache.hits, cache.misses))
+
+def print_diff(diff, log=six.print_):
     lines = []
         
     lines.append('*** PARAMETERS TO ADD ***')
@@ -87,7 +265,7 @@ def print_diff(diff):
     
     lines.append('*** PARAMETERS TO REMOVE ***')
     lines.extend(diff.remove)
-    six.print_('\n'.join(lines))
+    log('\n'.join(lines))
     
 def _load_files_args_helper(parser, args, add_parser_args=None):
     parser.add_argument('parameter_file', type=argparse.FileType('r'), nargs='+')
@@ -100,9 +278,16 @@ def _load_files_args_helper(parser, args, add_parser_args=None):
     add_input_args(parser, defaults)
     add_echo_args(parser, defaults)
     add_prompt_args(parser, defaults)
+    add_crypto_args(parser)
+    parser.add_argument('--file-cache', action='store_true',
+                        help='Cache the parsed parameter files on disk, and load unchanged files from the cache')
+    parser.add_argument('--parse-processes', type=int, metavar='N',
+                        help='Parse the parameter files in N processes (default: one per CPU with {} or more files)'.format(
+                            PARALLEL_PARSE_MIN_FILES))
     
     parser.set_defaults(**defaults)
     args = parser.parse_args(args=args)
+    configure_crypto(args)
     
     inputs = load_inputs_from_args(args)
     
@@ -113,13 +298,54 @@ def _load_files_main_helper(parser, args, add_parser_args=None, load_parameter_f
     
     parameter_files = {pf.name: pf for pf in args.parameter_file}
     
+    load_parameter_files_kwargs = dict(load_parameter_files_kwargs, processes=args.parse_processes)
+    file_cache = None
+    if args.file_cache:
+        file_cache = ParameterFileCache()
+        load_parameter_files_kwargs['cache'] = file_cache
+    
     names, parameters, base_paths = load_parameters(parameter_files,
                               prompt=args.prompt,
                               echo=args.echo,
                               inputs=inputs,
                               load_parameter_files_kwargs=load_parameter_files_kwargs)
+    
+    if file_cache is not None:
+        file_cache.prune()
     return args, names, parameters, base_paths
 
+def _deploy(client, args, names, parameters, base_paths, log=six.print_):
+    """Deploy the loaded parameters using the given client, returning the failed PutResults"""
+    index = None
+    if args.diff:
+        index = client.index_paths(base_paths, names, concurrency=args.concurrency)
+        print_diff(index.diff(), log=log)
+    
+    if args.delete:
+        log("Processing removed parameters...")
+        flush(base_paths, names, index=index, client=client, log=log)
+    
+    parameters_to_put = [p for p in six.itervalues(parameters) if not p.disable]
+    
+    # Successful puts are recorded in the snapshots, so the next run doesn't see them as missing
+    snapshots = get_snapshots(base_paths, client=client)
+    if args.changed_only:
+        log("Comparing with current values...")
+        changed = changed_parameters(parameters_to_put, concurrency=args.concurrency, snapshots=snapshots, client=client)
+        log("Skipping {} unchanged parameters".format(len(parameters_to_put) - len(changed)))
+        parameters_to_put = changed
+    
+    log("Putting parameters")
+    results = client.batch_put(parameters_to_put,
+                               dumper=SSMParameter.ssm_client_dumper,
+                               concurrency=args.concurrency,
+                               rate=args.put_rate)
+    record_puts(snapshots, parameters_to_put, results)
+
+    errors = [result for result in results if result.error]
+    log("Put {} parameters".format(len(results) - len(errors)))
+    return errors
+
 def deploy_main(args=None):
     def add_parser_args(parser):
         parser.add_argument('--overwrite', action='store_true', default=False, help='Allow overwrites by default')
@@ -127,13 +353,30 @@ def deploy_main(args=None):
         
         parser.add_argument('--dry-run', action='store_true')
         parser.add_argument('--diff', action='store_true')
-    
+
+        parser.add_argument('--concurrency', type=int, default=SSMClient.PUT_CONCURRENCY, help='Number of parallel PutParameter calls')
+        parser.add_argument('--put-rate', type=float, help='Maximum PutParameter calls per second')
+        parser.add_argument('--changed-only', action='store_true', help='Only put parameters that differ from their current values')
+        parser.add_argument('--decrypt-concurrency', type=int, default=DECRYPT_CONCURRENCY,
+                            help='Number of values to decrypt in parallel before putting')
+        parser.add_argument('--regions', type=lambda s: [r.strip() for r in s.split(',') if r.strip()],
+                            help='Comma-separated regions to deploy to in parallel')
+        
+        add_snapshot_args(parser)
+
     parser = argparse.ArgumentParser()
     
     args, names, parameters, base_paths = _load_files_main_helper(parser, args, add_parser_args=add_parser_args)
+    configure_snapshot_cache(args)
+    SSMParameter.OVERWRITE_DEFAULT = args.overwrite
     
-    if args.diff:
-        diff = SSMClient.diff_paths(base_paths, names)
+    if args.regions:
+        # Inputs are resolved once for all regions, so $(Region) can't differ between them
+        if 'Region' in VarString.NAMES and not any(name == 'Region' for name, _ in args.input):
+            parser.error("--regions cannot be used with parameter files that reference $(Region)")
+        clients = [SSMClient(region_name=region) for region in args.regions]
+    else:
+        clients = [SSMClient.default()]
 
     if args.dry_run:
         kwargs = {
@@ -145,30 +388,47 @@ def deploy_main(args=None):
         six.print_(yaml.dump(data, default_flow_style=False))
 
         if args.diff:
-            print_diff(diff)
+            for client in clients:
+                if args.regions:
+                    six.print_('*** REGION {} ***'.format(client.get_region()))
+                print_diff(client.diff_paths(base_paths, names, concurrency=args.concurrency))
         return
     
-    if args.diff:
-        print_diff(diff)
-    
-    if args.delete:
-        six.print_("Processing removed parameters...")
-        flush(base_paths, names)
-    
-    six.print_("Putting parameters")
-    SSMParameter.OVERWRITE_DEFAULT = args.overwrite
-    SSMClient.batch_put(list(six.itervalues(parameters)), dumper=SSMParameter.ssm_client_dumper)
+    # Decrypt everything before any puts, so the puts don't wait on KMS
+    decrypt_values(six.itervalues(parameters), concurrency=args.decrypt_concurrency)
+    
+    def deploy_to(client):
+        prefix = '[{}] '.format(client.get_region()) if args.regions else ''
+        log = lambda message: six.print_(prefix + message.replace('\n', '\n' + prefix))
+        try:
+            errors = _deploy(client, args, names, parameters, base_paths, log=log)
+        finally:
+            if args.regions:
+                if client.SNAPSHOT_CACHE is not None:
+                    client.save_snapshots()
+                report_rate(client, prefix=prefix)
+        for result in errors:
+            sys.stderr.write('{}Failed to put {}: {}\n'.format(prefix, result.name, result.error))
+        return len(errors)
+    
+    if sum(util.concurrent_map(deploy_to, clients, len(clients))):
+        sys.exit(1)
 
 def diff_main(args=None):
+    def add_parser_args(parser):
+        parser.add_argument('--concurrency', type=int, default=SSMClient.LIST_CONCURRENCY, help='Number of paths to list in parallel')
+        add_snapshot_args(parser)
+    
     parser = argparse.ArgumentParser()
     
     load_parameter_files_kwargs = {
         'var_mode': 'reduced'
     }
     
-    args, names, parameters, base_paths = _load_files_main_helper(parser, args, load_parameter_files_kwargs=load_parameter_files_kwargs)
+    args, names, parameters, base_paths = _load_files_main_helper(parser, args, add_parser_args=add_parser_args, load_parameter_files_kwargs=load_parameter_files_kwargs)
+    configure_snapshot_cache(args)
     
-    diff = SSMClient.diff_paths(base_paths, names)
+    diff = SSMClient.diff_paths(base_paths, names, concurrency=args.concurrency)
     
     print_diff(diff)
 
@@ -179,24 +439,36 @@ def delete_main(args=None):
         'var_mode': 'reduced'
     }
     
-    args, names, parameters, base_paths = _load_files_main_helper(parser, args, load_parameter_files_kwargs=load_parameter_files_kwargs)
+    args, names, parameters, base_paths = _load_files_main_helper(parser, args, add_parser_args=add_snapshot_args, load_parameter_files_kwargs=load_parameter_files_kwargs)
+    configure_snapshot_cache(args)
     
     flush(base_paths, names)
     
     six.print_("Deleting parameters")
     SSMClient.delete(names)
 
-def _download_helper(paths):
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, not {}".format(value))
+    return number
+
+def _download_helper(paths, concurrency=None, page_size=None, prefetch=None, shards=None):
     paths = [re.sub(r'/+$', '', p) for p in paths]
     
     if len(paths) == 1:
         base_path = paths[0]
     else:
         base_path = None
-        
-    parameters = []
-    for path in paths:
-        parameters.extend(SSMClient.get_path(path, full=True, loader=SSMParameter.ssm_client_loader))
+    
+    if shards:
+        parameters = []
+        for path in paths:
+            parameters.extend(SSMClient.get_path_sharded(path, shards=shards, loader=SSMParameter.ssm_client_loader,
+                                                         concurrency=concurrency))
+    else:
+        parameters = SSMClient.get_paths(paths, full=True, loader=SSMParameter.ssm_client_loader, concurrency=concurrency,
+                                         page_size=page_size, prefetch=prefetch)
     
     ssm_param_file_data = compile_parameter_file(parameters, base_path)
     
@@ -208,19 +480,83 @@ def download_main(args=None):
     parser.add_argument('path', nargs='+')
     parser.add_argument('--output', '-o', type=argparse.FileType('w'))
     parser.add_argument('--reencrypt-key-id')
+    parser.add_argument('--concurrency', type=int, default=SSMClient.LIST_CONCURRENCY, help='Number of paths (or shards) to get in parallel')
+    parser.add_argument('--shards', type=positive_int, help='Split each path into this many shards, listed and fetched in parallel')
+    parser.add_argument('--reencrypt-concurrency', type=int, default=SSMClient.REENCRYPT_CONCURRENCY,
+                        help='Number of SecureStrings to reencrypt in parallel')
+    parser.add_argument('--page-size', type=int, help='Number of parameters to request per page')
+    parser.add_argument('--prefetch', type=int, default=SSMClient.PREFETCH_PAGES,
+                        help='Number of pages to fetch ahead while earlier pages are processed (0 to disable)')
+    add_crypto_args(parser)
     
     args = parser.parse_args(args=args)
+    configure_crypto(args)
     
     if args.reencrypt_key_id:
         SSMClient.set_reencrypt_key(args.reencrypt_key_id)
+    SSMClient.REENCRYPT_CONCURRENCY = args.reencrypt_concurrency
     
-    ssm_param_file_data = _download_helper(args.path)
+    ssm_param_file_data = _download_helper(args.path, concurrency=args.concurrency,
+                                           page_size=args.page_size, prefetch=args.prefetch, shards=args.shards)
     
     if not args.output:
         args.output = sys.stdout
     
     yaml.safe_dump(ssm_param_file_data, args.output, default_flow_style=False)
 
+def _parse_datetime(value):
+    from dateutil import parser, tz
+    value = parser.parse(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=tz.tzutc())
+    return value
+
+def history_main(args=None):
+    """
+    ssm-ctl history [--limit N | --latest N] [--since DATE] [--until DATE] NAME
+    """
+    parser = argparse.ArgumentParser()
+    
+    parser.add_argument('name')
+    limit_group = parser.add_mutually_exclusive_group()
+    limit_group.add_argument('--limit', type=int, help='Stop after the oldest N matching versions')
+    limit_group.add_argument('--latest', type=int, help='Only the newest N matching versions, newest first')
+    parser.add_argument('--since', type=_parse_datetime)
+    parser.add_argument('--until', type=_parse_datetime)
+    parser.add_argument('--min-version', type=int)
+    parser.add_argument('--max-version', type=int)
+    parser.add_argument('--output', '-o', type=argparse.FileType('w'))
+    parser.add_argument('--reencrypt-key-id')
+    
+    args = parser.parse_args(args=args)
+    
+    if args.reencrypt_key_id:
+        SSMClient.set_reencrypt_key(args.reencrypt_key_id)
+    
+    if not args.output:
+        args.output = sys.stdout
+    
+    kwargs = {
+        'loader': SSMParameter.ssm_client_loader,
+        'since': args.since,
+        'until': args.until,
+        'min_version': args.min_version,
+        'max_version': args.max_version,
+    }
+    if args.latest is not None:
+        versions = SSMClient.get_versions(args.name, limit=args.latest, **kwargs)
+    else:
+        versions = SSMClient.iter_versions(args.name, limit=args.limit, **kwargs)
+    
+    for parameter in versions:
+        data = parameter.dump()
+        data['Version'] = parameter.version
+        data['LastModifiedDate'] = parameter.last_modified_date
+        if parameter.last_modified_user:
+            data['LastModifiedUser'] = parameter.last_modified_user
+        yaml.safe_dump(data, args.output, default_flow_style=False, explicit_start=True)
+        args.output.flush()
+
 def encrypt_main(args=None):
     """
     ssm-ctl encrypt PARAMETER_FILE NAME VALUE [NAME VALUE]...
@@ -235,14 +571,16 @@ def encrypt_main(args=None):
     prompt_group = parser.add_argument_group()
     prompt_group.add_argument('--prompt', action='store_true')
     prompt_group.add_argument('--echo', action='store_true')
+    add_crypto_args(parser)
     
     args = parser.parse_args(args=args)
+    configure_crypto(args)
     
     input_fn = getpass.getpass if not args.echo else input
     
     if os.path.exists(args.parameter_file):
         with open(args.parameter_file, 'r') as fp:
-            parameter_file = yaml.safe_load(fp)
+            parameter_file = load_yaml(fp)
     else:
         parameter_file = {}
     
@@ -281,7 +619,7 @@ def decrypt_main(args=None):
     
     args = parser.parse_args(args=args)
     
-    parameter_file = yaml.safe_load(args.parameter_file)
+    parameter_file = load_yaml(args.parameter_file)
     
     for path, data in six.iteritems(parameter_file):
         if isinstance(data, dict) and 'EncryptedValue' in data:
@@ -295,10 +633,11 @@ def main(args=None):
     if args is None:
         args = sys.argv[1:]
     
-    commands = ['deploy', 'diff', 'delete', 'download', 'encrypt', 'decrypt']
+    commands = ['deploy', 'diff', 'delete', 'download', 'history', 'encrypt', 'decrypt']
     
     parser = argparse.ArgumentParser()
     parser.add_argument('command', choices=commands)
+    add_global_args(parser)
     
     if (not args
         or (len(args) == 1 and args[0] in ['--help', '-h'])
@@ -307,4 +646,43 @@ def main(args=None):
         sys.exit(1)
     
     command = args[0]
-    return globals()['{}_main'.format(command)](args[1:])
\ No newline at end of file
+    
+    # The global options are accepted by every command
+    global_parser_kwargs = {'allow_abbrev': False} if sys.version_info >= (3, 5) else {}
+    global_parser = argparse.ArgumentParser(add_help=False, **global_parser_kwargs)
+    add_global_args(global_parser)
+    global_args, command_args = global_parser.parse_known_args(_split_profile_arg(args[1:]))
+    stats_sinks = get_stats_sinks(global_args)
+    # The counts and latencies are always collected, for the crypto report; the sizes
+    # of requests and responses are only measured for the stats options
+    SSMClient.STATS = stats.Stats(sizes=bool(stats_sinks))
+    tracer = None
+    if global_args.trace:
+        tracer = trace.ChromeTracer()
+        trace.set_tracer(tracer)
+    
+    SSMClient.DECRYPT_CACHE = DecryptCache()
+    try:
+        command_main = lambda: globals()['{}_main'.format(command)](command_args)
+        with trace.span(command):
+            if global_args.profile is not None:
+                return profiling.run_profiled(command_main,
+                    global_args.profile or profiling.default_file_name(command, global_args.profile_mode),
+                    mode=global_args.profile_mode,
+                    top=global_args.profile_top)
+            return command_main()
+    finally:
+        if SSMClient.SNAPSHOT_CACHE is not None:
+            SSMClient.save_snapshots()
+            SSMClient.SNAPSHOT_CACHE.prune()
+        report_rate()
+        report_crypto()
+        report_decrypt_cache()
+        SSMClient.DECRYPT_CACHE.clear()
+        SSMClient.DECRYPT_CACHE = None
+        if stats_sinks:
+            emit_stats(stats_sinks)
+        SSMClient.STATS = None
+        if tracer is not None:
+            trace.set_tracer(None)
+            tracer.save(global_args.trace)
\ No newline at end of file
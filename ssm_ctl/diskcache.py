@@ -0,0 +1,108 @@
+"""Directories of cache files, evicted by age and size
+
+Copyright 2018 iRobot Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from __future__ import absolute_import, print_function
+
+import errno
+import os
+import os.path
+import stat
+import tempfile
+import time
+
+def get_cache_dir(name):
+    """The directory for the named cache, under $SSMCTL_CACHE_DIR (default ~/.cache/ssm-ctl)"""
+    base = os.environ.get('SSMCTL_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'ssm-ctl')
+    return os.path.join(base, name)
+
+def _is_private(stat_result):
+    """True if the file is owned by the user and not accessible by anyone else.
+    Without POSIX ownership (i.e., on Windows) this can't be checked."""
+    if not hasattr(os, 'getuid'):
+        return True
+    return stat_result.st_uid == os.getuid() and not stat.S_IMODE(stat_result.st_mode) & 0o077
+
+class DiskCache(object):
+    """A directory of cache files ending in SUFFIX, created only accessible by the user.
+    Files are written atomically, and evicted by prune().
+    :param max_age: Files not modified for this many seconds are evicted.
+    :param max_bytes: The least recently modified files are evicted to keep the cache under this size.
+    """
+    SUFFIX = None
+    DEFAULT_MAX_AGE = None
+    DEFAULT_MAX_BYTES = None
+
+    def __init__(self, directory, max_age=None, max_bytes=None):
+        self.directory = directory
+        self.max_age = max_age if max_age is not None else self.DEFAULT_MAX_AGE
+        self.max_bytes = max_bytes if max_bytes is not None else self.DEFAULT_MAX_BYTES
+
+    def _ensure_directory(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, 0o700)
+
+    def _file(self, digest):
+        return os.path.join(self.directory, digest + self.SUFFIX)
+
+    def _write(self, file_name, dump, mode='w'):
+        """Call dump with a temporary file in the cache, then move it to file_name"""
+        self._ensure_directory()
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, mode) as fp:
+                dump(fp)
+            os.rename(tmp_name, file_name)
+        except BaseException:
+            os.remove(tmp_name)
+            raise
+
+    def _open_private(self, file_name, mode='rb'):
+        """Open a file in the cache for reading, raising IOError if it or the cache directory
+        is owned by someone else or accessible by others, so that untrusted files
+        (e.g., in a shared SSMCTL_CACHE_DIR) are never loaded."""
+        if not _is_private(os.stat(self.directory)):
+            raise IOError(errno.EACCES, 'Cache directory is not private', self.directory)
+        fp = open(file_name, mode)
+        if not _is_private(os.fstat(fp.fileno())):
+            fp.close()
+            raise IOError(errno.EACCES, 'Cache file is not private', file_name)
+        return fp
+
+    def prune(self):
+        """Evict files by age, then the least recently modified ones until the cache fits in max_bytes"""
+        if not os.path.isdir(self.directory):
+            return
+        now = time.time()
+        files = []
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(self.SUFFIX):
+                continue
+            file_name = os.path.join(self.directory, file_name)
+            try:
+                stat_result = os.stat(file_name)
+            except OSError:
+                continue
+            if now - stat_result.st_mtime > self.max_age:
+                os.remove(file_name)
+            else:
+                files.append((stat_result.st_mtime, stat_result.st_size, file_name))
+        total = sum(size for _, size, _ in files)
+        for _, size, file_name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            os.remove(file_name)
+            total -= size
@@ -0,0 +1,363 @@
+"""In-memory stand-ins for SSM Parameter Store, STS, and KMS, for tests and benchmarks
+
+Copyright 2018 iRobot Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from __future__ import absolute_import, print_function
+
+import six
+import base64
+import bisect
+import collections
+import datetime
+import json
+import random
+import threading
+import time
+
+from .rate import TokenBucket
+
+try:
+    from botocore.exceptions import ClientError
+except ImportError:
+    class ClientError(Exception):
+        """Stand-in for botocore's ClientError, with the same response structure"""
+        def __init__(self, error_response, operation_name):
+            self.response = error_response
+            self.operation_name = operation_name
+            error = error_response.get('Error', {})
+            super(ClientError, self).__init__('An error occurred ({}) when calling the {} operation: {}'.format(
+                error.get('Code', 'Unknown'), operation_name, error.get('Message', 'Unknown')))
+
+def _error(code, message, operation):
+    return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+def _now():
+    from dateutil import tz
+    return datetime.datetime.now(tz.tzutc())
+
+class _Service(object):
+    """Latency, TPS quota, and throttle injection shared by the fake services.
+    :param latency: Seconds each call takes, or a function returning them.
+    :param tps: Calls per second allowed for each operation, as a number for all operations,
+        or a dict of operation name to number. Calls over the quota fail with ThrottlingException.
+    :param throttle_probability: The chance that any call fails with ThrottlingException.
+    """
+
+    def __init__(self, latency=0, tps=None, throttle_probability=0):
+        self.latency = latency
+        self.tps = tps
+        self.throttle_probability = throttle_probability
+
+        self.calls = collections.Counter()
+        self.throttles = collections.Counter()
+
+        self._lock = threading.RLock()
+        self._quotas = {}
+
+    def _quota(self, operation):
+        with self._lock:
+            if operation not in self._quotas:
+                tps = self.tps.get(operation) if isinstance(self.tps, dict) else self.tps
+                self._quotas[operation] = TokenBucket(tps)
+            return self._quotas[operation]
+
+    def _call(self, operation):
+        with self._lock:
+            self.calls[operation] += 1
+        latency = self.latency() if callable(self.latency) else self.latency
+        if latency:
+            time.sleep(latency)
+        if not self._quota(operation).try_acquire() or (
+                self.throttle_probability and random.random() < self.throttle_probability):
+            with self._lock:
+                self.throttles[operation] += 1
+            raise _error('ThrottlingException', 'Rate exceeded', operation)
+
+class FakeKMS(_Service):
+    """Fake envelope encryption for the SSMClient _ENCRYPTER and _DECRYPTER hooks.
+    Ciphertexts are base64-encoded JSON of the key id and plaintext; they are not secure."""
+
+    def encrypt(self, plaintext, key_id):
+        self._call('Encrypt')
+        if isinstance(plaintext, six.binary_type):
+            plaintext = plaintext.decode('utf-8')
+        data = json.dumps({'KeyId': key_id, 'Plaintext': plaintext}, sort_keys=True)
+        return base64.b64encode(data.encode('utf-8')).decode('ascii')
+
+    def decrypt(self, ciphertext):
+        self._call('Decrypt')
+        try:
+            data = json.loads(base64.b64decode(ciphertext).decode('utf-8'))
+        except (TypeError, ValueError):
+            raise _error('InvalidCiphertextException', 'Invalid ciphertext', 'Decrypt')
+        return data['Plaintext']
+
+class FakeSTS(object):
+    def __init__(self, account):
+        self.account = account
+
+    def get_caller_identity(self):
+        return {'Account': self.account, 'Arn': 'arn:aws:iam::{}:root'.format(self.account), 'UserId': self.account}
+
+class FakePaginator(object):
+    def __init__(self, method):
+        self._method = method
+
+    def paginate(self, **kwargs):
+        kwargs = dict(kwargs)
+        config = kwargs.pop('PaginationConfig', {})
+        if 'PageSize' in config:
+            kwargs['MaxResults'] = config['PageSize']
+        while True:
+            response = self._method(**kwargs)
+            yield response
+            if not response.get('NextToken'):
+                break
+            kwargs['NextToken'] = response['NextToken']
+
+class FakeSSM(_Service):
+    """A boto3-like SSM client over an in-memory parameter store, with the
+    Parameter Store operations ssm-ctl uses, their page size limits, and paginators.
+    SecureString values are stored in plaintext and returned as opaque ciphertexts
+    when WithDecryption is false."""
+
+    MAX_RESULTS = {
+        'get_parameters_by_path': 10,
+        'get_parameter_history': 50,
+        'describe_parameters': 50,
+    }
+
+    _DESCRIBE_KEYS = ['Name', 'Type', 'KeyId', 'LastModifiedDate', 'LastModifiedUser',
+                      'Description', 'AllowedPattern', 'Version', 'Tier', 'Policies', 'DataType']
+
+    def __init__(self, region_name='us-east-1', account='123456789012', **kwargs):
+        super(FakeSSM, self).__init__(**kwargs)
+        self.region_name = region_name
+        self.account = account
+        self._history = {}
+        self._names = []
+
+    @property
+    def parameters(self):
+        """The latest version of each parameter, by name"""
+        with self._lock:
+            return dict((name, versions[-1]) for name, versions in six.iteritems(self._history))
+
+    def _arn(self, name):
+        return 'arn:aws:ssm:{}:{}:parameter/{}'.format(self.region_name, self.account, name.lstrip('/'))
+
+    def _page(self, operation, items, kwargs, convert=None):
+        max_results = kwargs.get('MaxResults', self.MAX_RESULTS[operation])
+        if max_results > self.MAX_RESULTS[operation]:
+            raise _error('ValidationException', 'MaxResults must be at most {}'.format(self.MAX_RESULTS[operation]), operation)
+        start = int(kwargs.get('NextToken') or 0)
+        page = items[start:start + max_results]
+        response = {'Parameters': [convert(item) for item in page] if convert else page}
+        if start + max_results < len(items):
+            response['NextToken'] = str(start + max_results)
+        return response
+
+    def _value(self, item, decrypt):
+        result = dict((key, item[key]) for key in ['Name', 'Type', 'Value', 'Version', 'LastModifiedDate', 'DataType'])
+        result['ARN'] = self._arn(item['Name'])
+        if item['Type'] == 'SecureString' and not decrypt:
+            result['Value'] = base64.b64encode(json.dumps([item['KeyId'], item['Version']]).encode('utf-8')).decode('ascii')
+        return result
+
+    def _metadata(self, item):
+        return dict((key, item[key]) for key in self._DESCRIBE_KEYS if key in item)
+
+    def _matches(self, item, parameter_filters):
+        name = item['Name']
+        for f in parameter_filters:
+            key, option, values = f['Key'], f.get('Option', 'Equals'), f.get('Values', [])
+            if key == 'Path':
+                path = values[0].rstrip('/')
+                if not name.startswith(path + '/'):
+                    return False
+                if option == 'OneLevel' and '/' in name[len(path) + 1:]:
+                    return False
+            elif key == 'Name':
+                if option == 'BeginsWith':
+                    if not any(name.startswith(v) for v in values):
+                        return False
+                elif name not in values:
+                    return False
+            elif key in ('Type', 'KeyId', 'Tier', 'DataType'):
+                if item.get(key) not in values:
+                    return False
+            else:
+                raise _error('InvalidFilterKey', 'Unsupported filter key {}'.format(key), 'DescribeParameters')
+        return True
+
+    def _latest(self, parameter_filters=()):
+        """The latest versions of the parameters matching the filters, in name order.
+        Name and Path filters narrow the candidates using the sorted names."""
+        prefix = ''
+        names = None
+        for f in parameter_filters:
+            key, option, values = f['Key'], f.get('Option', 'Equals'), f.get('Values', [])
+            if key == 'Path':
+                prefix = max(prefix, values[0].rstrip('/') + '/', key=len)
+            elif key == 'Name' and option == 'BeginsWith' and len(values) == 1:
+                prefix = max(prefix, values[0], key=len)
+            elif key == 'Name' and option == 'Equals':
+                names = values
+        with self._lock:
+            if names is not None:
+                candidates = sorted(name for name in set(names) if name in self._history)
+            else:
+                candidates = []
+                for name in self._names[bisect.bisect_left(self._names, prefix):]:
+                    if not name.startswith(prefix):
+                        break
+                    candidates.append(name)
+            items = [self._history[name][-1] for name in candidates]
+        return [item for item in items if self._matches(item, parameter_filters)]
+
+    def put_parameter(self, Name, Value, Type=None, Description=None, KeyId=None, Overwrite=False,
+                      AllowedPattern=None, Tier='Standard', DataType='text', **kwargs):
+        self._call('PutParameter')
+        with self._lock:
+            if Name not in self._history:
+                bisect.insort(self._names, Name)
+            versions = self._history.setdefault(Name, [])
+            if versions and not Overwrite:
+                raise _error('ParameterAlreadyExists', 'The parameter already exists.', 'PutParameter')
+            previous = versions[-1] if versions else {}
+            item = {
+                'Name': Name,
+                'Type': Type or previous.get('Type', 'String'),
+                'Value': Value,
+                'Version': len(versions) + 1,
+                'LastModifiedDate': _now(),
+                'LastModifiedUser': 'arn:aws:iam::{}:root'.format(self.account),
+                'Tier': Tier,
+                'Policies': [],
+                'DataType': DataType,
+                'Labels': [],
+            }
+            for key, value in [('Description', Description), ('KeyId', KeyId), ('AllowedPattern', AllowedPattern)]:
+                if value is not None:
+                    item[key] = value
+            if item['Type'] == 'SecureString':
+                item.setdefault('KeyId', previous.get('KeyId', 'alias/aws/ssm'))
+            versions.append(item)
+            return {'Version': item['Version'], 'Tier': Tier}
+
+    def get_parameters(self, Names, WithDecryption=False):
+        self._call('GetParameters')
+        if len(Names) > 10:
+            raise _error('ValidationException', 'At most 10 names can be given', 'GetParameters')
+        with self._lock:
+            found = [self._value(self._history[name][-1], WithDecryption) for name in Names if name in self._history]
+            invalid = [name for name in Names if name not in self._history]
+        return {'Parameters': found, 'InvalidParameters': invalid}
+
+    def get_parameters_by_path(self, Path, Recursive=False, ParameterFilters=(), WithDecryption=False, **kwargs):
+        self._call('GetParametersByPath')
+        filters = [{'Key': 'Path', 'Option': 'Recursive' if Recursive else 'OneLevel', 'Values': [Path]}]
+        filters.extend(ParameterFilters or [])
+        return self._page('get_parameters_by_path', self._latest(filters), kwargs,
+                          lambda item: self._value(item, WithDecryption))
+
+    def get_parameter_history(self, Name, WithDecryption=False, **kwargs):
+        self._call('GetParameterHistory')
+        with self._lock:
+            if Name not in self._history:
+                raise _error('ParameterNotFound', 'Parameter {} not found.'.format(Name), 'GetParameterHistory')
+            items = []
+            for item in self._history[Name]:
+                result = self._metadata(item)
+                result.update(self._value(item, WithDecryption))
+                result['Labels'] = list(item['Labels'])
+                items.append(result)
+        return self._page('get_parameter_history', items, kwargs)
+
+    def describe_parameters(self, Filters=(), ParameterFilters=(), **kwargs):
+        self._call('DescribeParameters')
+        filters = [{'Key': f['Key'], 'Values': f['Values']} for f in Filters or []]
+        filters.extend(ParameterFilters or [])
+        return self._page('describe_parameters', self._latest(filters), kwargs, self._metadata)
+
+    def delete_parameters(self, Names):
+        self._call('DeleteParameters')
+        if len(Names) > 10:
+            raise _error('ValidationException', 'At most 10 names can be given', 'DeleteParameters')
+        with self._lock:
+            deleted = [name for name in Names if self._history.pop(name, None) is not None]
+            for name in deleted:
+                del self._names[bisect.bisect_left(self._names, name)]
+        return {'DeletedParameters': deleted, 'InvalidParameters': [name for name in Names if name not in deleted]}
+
+    def can_paginate(self, operation):
+        return operation in self.MAX_RESULTS
+
+    def get_paginator(self, operation):
+        if not self.can_paginate(operation):
+            raise ValueError("Operation {} cannot be paginated".format(operation))
+        return FakePaginator(getattr(self, operation))
+
+class FakeSession(object):
+    """A boto3-like session whose clients are the given fakes"""
+
+    def __init__(self, region_name, clients):
+        self.region_name = region_name
+        self._clients = clients
+
+    def client(self, name, **kwargs):
+        return self._clients[name]
+
+class FakeBackend(object):
+    """A fake SSM Parameter Store, STS, and KMS for one account and region.
+    The latency, tps, and throttle_probability (see _Service) apply to SSM;
+    kms_latency, kms_tps, and kms_throttle_probability to KMS."""
+
+    def __init__(self, region_name='us-east-1', account='123456789012', latency=0, tps=None, throttle_probability=0,
+                 kms_latency=0, kms_tps=None, kms_throttle_probability=0):
+        self.region_name = region_name
+        self.account = account
+        self.ssm = FakeSSM(region_name=region_name, account=account,
+            latency=latency, tps=tps, throttle_probability=throttle_probability)
+        self.kms = FakeKMS(latency=kms_latency, tps=kms_tps, throttle_probability=kms_throttle_probability)
+        self.sts = FakeSTS(account)
+        self.session = FakeSession(region_name, {'ssm': self.ssm, 'sts': self.sts})
+
+    def install(self, target):
+        """Set the factories and crypto hooks of target (SSMClient, a subclass, or an instance)
+        to use this backend. Returns a function that restores the previous hooks."""
+        hooks = {
+            'SESSION_FACTORY': lambda: self.session,
+            'CLIENT_FACTORY': lambda session, name: session.client(name),
+            '_ENCRYPTER': self.kms.encrypt,
+            '_DECRYPTER': self.kms.decrypt,
+        }
+        is_class = isinstance(target, type)
+        previous = dict((name, target.__dict__[name]) for name in hooks if name in target.__dict__)
+        for name, hook in six.iteritems(hooks):
+            setattr(target, name, hook)
+        if is_class:
+            target.set_default(None)
+
+        def uninstall():
+            for name in hooks:
+                if name in previous:
+                    setattr(target, name, previous[name])
+                else:
+                    delattr(target, name)
+            if is_class:
+                target.set_default(None)
+        return uninstall
@@ -0,0 +1,70 @@
+"""On-disk cache of parsed parameter files
+
+Copyright 2018 iRobot Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from __future__ import absolute_import, print_function
+
+import six
+from six.moves import cPickle as pickle
+import os
+import hashlib
+import sys
+
+from . import __version__
+from .diskcache import DiskCache, get_cache_dir
+
+class ParameterFileCache(DiskCache):
+    """A directory of parsed parameter files (ParameterFileData, before inputs are resolved),
+    keyed by a hash of the file's contents, the var_mode, and the ssm-ctl and Python versions.
+    Entries are pickles, so they are only loaded if they and the directory are owned by
+    the user and not accessible by anyone else.
+    :param max_age: Entries not used for this many seconds are evicted.
+    :param max_bytes: The least recently used entries are evicted to keep the cache under this size.
+    """
+    SUFFIX = '.pickle'
+    DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+    DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, directory=None, max_age=None, max_bytes=None):
+        super(ParameterFileCache, self).__init__(directory or get_cache_dir('files'), max_age=max_age, max_bytes=max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def _text_file(self, text, var_mode):
+        if isinstance(text, six.text_type):
+            text = text.encode('utf-8')
+        digest = hashlib.sha256()
+        digest.update('{}\0{}\0{}.{}\0'.format(__version__, var_mode, *sys.version_info[:2]).encode('utf-8'))
+        digest.update(text)
+        return self._file(digest.hexdigest())
+
+    def load(self, text, var_mode):
+        """The cached ParameterFileData for the file contents, or None"""
+        file_name = self._text_file(text, var_mode)
+        try:
+            with self._open_private(file_name) as fp:
+                data = pickle.load(fp)
+            os.utime(file_name, None)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def save(self, text, var_mode, data):
+        self._write(self._text_file(text, var_mode),
+                    lambda fp: pickle.dump(data, fp, pickle.HIGHEST_PROTOCOL),
+                    mode='wb')
@@ -23,12 +23,19 @@ from six.moves import input
 import re
 import collections
 import getpass
+import multiprocessing
 import sys
 
 import yaml
+try:
+    from yaml import CSafeLoader as _SafeLoader
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader
 
 from .ssm import SSMClient
 from .parameters import SSMParameter
+from . import util
+from . import trace
 from .util import VarString
 
 class InputError(Exception):
@@ -203,24 +210,89 @@ BASEPATH_KEY = '.BASEPATH'
 
 COMMON_KEY = '.COMMON'
 
-def load_parameter_files(parameter_files, inputs=None, var_mode='all'):
+def load_yaml(stream):
+    """yaml.safe_load, using libyaml when PyYAML was built with it"""
+    return yaml.load(stream, Loader=_SafeLoader)
+
+def _parse_parameter_file_text(args):
+    text, var_mode = args
+    return parse_parameter_file(load_yaml(text), var_mode=var_mode)
+
+PARALLEL_PARSE_MIN_FILES = 8
+
+def _parse_parameter_files(file_names, texts, var_mode, processes=None):
+    """Parse the texts into a list of ParameterFileData in the same order. With processes
+    above 1 (by default, the number of CPUs if there are at least PARALLEL_PARSE_MIN_FILES
+    files), they are parsed in a process pool."""
+    if processes is None:
+        processes = multiprocessing.cpu_count() if len(texts) >= PARALLEL_PARSE_MIN_FILES else 1
+    processes = min(processes, len(texts))
+    if processes > 1:
+        try:
+            pool = multiprocessing.Pool(processes)
+        except (OSError, ImportError, NotImplementedError):
+            # e.g., no /dev/shm on AWS Lambda
+            pool = None
+        if pool is not None:
+            try:
+                with trace.span('parse_parameter_files', files=len(texts), processes=processes):
+                    return pool.map(_parse_parameter_file_text, [(text, var_mode) for text in texts], chunksize=1)
+            except Exception:
+                # Parse in this process to raise the original error for the failing file
+                pass
+            finally:
+                pool.close()
+                pool.join()
+    results = []
+    for file_name, text in zip(file_names, texts):
+        with trace.span('parse_parameter_file', file=file_name):
+            results.append(_parse_parameter_file_text((text, var_mode)))
+    return results
+
+def load_parameter_files(parameter_files, inputs=None, var_mode='all', cache=None, processes=None):
+    """Load the parameter files (a dict of file name to file or text) into a ParameterFileData.
+    With a cache (a filecache.ParameterFileCache), files whose contents are unchanged are
+    loaded from it instead of being parsed. The files are parsed using processes processes
+    (see _parse_parameter_files), and merged in order."""
     if inputs is None:
         inputs = {}
     parameters = {}
     base_paths = []
-    for parameter_file_name, parameter_file in six.iteritems(parameter_files):
-        six.print_("Loading {}...".format(parameter_file_name))
-        data = parse_parameter_file(yaml.safe_load(parameter_file), var_mode=var_mode)
-        Input.merge_inputs(inputs, data.inputs)
-        parameters.update(data.parameters)
-        base_paths.extend(data.base_paths)
+    with trace.span('load_parameter_files', files=len(parameter_files)):
+        file_names = []
+        texts = []
+        file_data = []
+        for parameter_file_name, parameter_file in six.iteritems(parameter_files):
+            six.print_("Loading {}...".format(parameter_file_name))
+            if hasattr(parameter_file, 'read'):
+                parameter_file = parameter_file.read()
+            file_names.append(parameter_file_name)
+            texts.append(parameter_file)
+            file_data.append(cache.load(parameter_file, var_mode) if cache is not None else None)
+        
+        to_parse = [i for i, data in enumerate(file_data) if data is None]
+        parsed = _parse_parameter_files(
+            [file_names[i] for i in to_parse],
+            [texts[i] for i in to_parse],
+            var_mode,
+            processes=processes)
+        for i, data in zip(to_parse, parsed):
+            file_data[i] = data
+            if cache is not None:
+                cache.save(texts[i], var_mode, data)
+        
+        for data in file_data:
+            Input.merge_inputs(inputs, data.inputs)
+            parameters.update(data.parameters)
+            base_paths.extend(data.base_paths)
     return ParameterFileData(inputs, parameters, base_paths)
 
 def process_inputs(inputs, prompt, echo):
     try:
         six.print_("Processing inputs...")
-        resolver = Input.get_resolver(inputs, prompt=prompt, echo=echo)
-        VarString.resolve(resolver)
+        with trace.span('process_inputs', inputs=len(inputs)):
+            resolver = Input.get_resolver(inputs, prompt=prompt, echo=echo)
+            VarString.resolve(resolver)
     except InputError as e:
         sys.stderr.write('{}\n'.format(e))
         sys.exit(1)
@@ -236,6 +308,28 @@ def load_parameters(parameter_files, inputs=None, prompt=None, echo=None, load_p
     
     return names, parameters, base_paths
 
+DECRYPT_CONCURRENCY = 8
+
+def decrypt_values(parameters, concurrency=None):
+    """Decrypt everything the parameters need decrypted, up front and concurrently using
+    concurrency threads (default DECRYPT_CONCURRENCY), so that putting them doesn't wait on KMS.
+    First the inputs referenced by SecureString Inputs, each once, then the parameters' values,
+    which are kept by the parameters."""
+    if concurrency is None:
+        concurrency = DECRYPT_CONCURRENCY
+    parameters = [p for p in parameters if p.type == 'SecureString' and not p.disable]
+    
+    input_names = set()
+    for parameter in parameters:
+        input_names.update(parameter.get_encrypted_references())
+    with trace.span('decrypt_values', inputs=len(input_names), parameters=len(parameters)):
+        util.concurrent_map(
+            lambda name: VarString.get_var_value(name).get_value(encrypted=True),
+            sorted(input_names),
+            concurrency)
+        
+        util.concurrent_map(lambda parameter: parameter.get_value(), parameters, concurrency)
+
 def parse_parameter_file(obj, var_mode='all'):
     inputs = Input.load(obj.get(INPUT_KEY, obj.get(_ALTERNATE_INPUT_KEY, {})))
     
@@ -20,6 +20,8 @@ from __future__ import absolute_import, print_function
 import six
 import re
 import base64
+import hashlib
+import json
 
 from .ssm import SSMClient
 from .util import VarString
@@ -146,6 +148,26 @@ class SSMParameter(object):
             item['Overwrite'] = parameter.overwrite
         return item
     
+    _COMPARED_FIELDS = ['Type', 'Value', 'Description', 'AllowedPattern', 'KeyId']
+    
+    def differs_from(self, item):
+        """Check if putting this parameter would change the given item, as returned by
+        SSMClient.get_current(). A missing item always differs."""
+        if not item:
+            return True
+        data = self.ssm_client_dumper(self) or {}
+        for field in self._COMPARED_FIELDS:
+            if data.get(field) != item.get(field):
+                return True
+        return False
+    
+    @classmethod
+    def content_hash(cls, item, salt=''):
+        """A hash of the fields compared by differs_from() in the given item,
+        either an SSM item or the output of ssm_client_dumper()"""
+        data = json.dumps([item.get(field) for field in cls._COMPARED_FIELDS])
+        return hashlib.sha256((salt + data).encode('utf-8')).hexdigest()
+    
     @classmethod
     def get_names(cls, parameters):
         return [p.get_name() for p in parameters if not p.disable]
@@ -218,6 +240,18 @@ class SSMParameter(object):
     def type(self):
         return self._type
     
+    @property
+    def encrypted(self):
+        """True if the value is stored encrypted, and decrypted to be put"""
+        return bool(self._encrypted)
+    
+    def get_encrypted_references(self):
+        """The names of the variables whose values are decrypted to get the value"""
+        values = self._value if isinstance(self._value, list) else [self._value]
+        return set(name for value in values
+                   if isinstance(value, VarString) and value.encrypted
+                   for name in value.names)
+    
     def get_value(self, decrypt=True):
         if not self._resolved_value:
             if self._value is None:
@@ -263,4 +297,6 @@ class SSMParameter(object):
             return bool(VarString.dump(self._disable))
     
     def put(self):
-        SSMClient.batch_put([self], dumper=self.ssm_client_dumper)
+        for result in SSMClient.batch_put([self], dumper=self.ssm_client_dumper):
+            if result.error:
+                raise result.error
@@ -0,0 +1,135 @@
+"""Index of parameter names by path
+
+Copyright 2018 iRobot Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from __future__ import absolute_import, print_function
+
+import six
+import collections
+
+PathDiff = collections.namedtuple('PathDiff', ['add', 'overwrite', 'remove'])
+
+LOCAL = 0
+REMOTE = 1
+
+class _Node(object):
+    __slots__ = ['children', 'counts', 'name', 'present']
+
+    def __init__(self):
+        self.children = {}
+        self.counts = [0, 0]
+        self.name = None
+        self.present = [False, False]
+
+class PathIndex(object):
+    """A trie of parameter names, split on '/', holding a local and a remote set of names.
+    Each node keeps the number of local and remote names in its subtree, so counts take
+    time proportional to the depth of the path, and listing names or diffing a subtree
+    takes time proportional to the output."""
+
+    def __init__(self, local=(), remote=()):
+        self._root = _Node()
+        for name in local:
+            self.add(name, LOCAL)
+        for name in remote:
+            self.add(name, REMOTE)
+
+    @classmethod
+    def _split(cls, path):
+        """The trie path of a name or prefix. Hierarchical names (starting with '/') are under
+        a '/' root segment, so that e.g. 'foo' and '/foo' are different names."""
+        parts = [part for part in path.split('/') if part]
+        if path.startswith('/'):
+            return ['/'] + parts
+        return parts
+
+    def _find(self, prefix):
+        node = self._root
+        for part in self._split(prefix):
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def add(self, name, side=LOCAL):
+        node = self._find(name)
+        if node is not None and node.present[side]:
+            return
+        node = self._root
+        node.counts[side] += 1
+        for part in self._split(name):
+            child = node.children.get(part)
+            if child is None:
+                child = node.children[part] = _Node()
+            child.counts[side] += 1
+            node = child
+        node.name = name
+        node.present[side] = True
+
+    def discard(self, name, side=LOCAL):
+        node = self._find(name)
+        if node is None or not node.present[side]:
+            return
+        node = self._root
+        node.counts[side] -= 1
+        for part in self._split(name):
+            child = node.children[part]
+            child.counts[side] -= 1
+            if not any(child.counts):
+                del node.children[part]
+                return
+            node = child
+        node.present[side] = False
+
+    def __contains__(self, name):
+        node = self._find(name)
+        return node is not None and any(node.present)
+
+    def count(self, prefix='', side=LOCAL):
+        """The number of names on the given side under the prefix path"""
+        node = self._find(prefix)
+        return node.counts[side] if node is not None else 0
+
+    def _walk(self, prefix, sides):
+        node = self._find(prefix)
+        if node is None:
+            return
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.name is not None:
+                yield node
+            stack.extend(child for child in six.itervalues(node.children)
+                         if any(child.counts[side] for side in sides))
+
+    def names(self, prefix='', side=LOCAL):
+        """The sorted names on the given side under the prefix path"""
+        return sorted(node.name for node in self._walk(prefix, [side]) if node.present[side])
+
+    def diff(self, prefix=''):
+        """A PathDiff of the local names against the remote names under the prefix path"""
+        add = []
+        overwrite = []
+        remove = []
+        for node in self._walk(prefix, [LOCAL, REMOTE]):
+            local, remote = node.present
+            if local and remote:
+                overwrite.append(node.name)
+            elif local:
+                add.append(node.name)
+            elif remote:
+                remove.append(node.name)
+        return PathDiff(sorted(add), sorted(overwrite), sorted(remove))
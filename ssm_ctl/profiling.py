@@ -0,0 +1,162 @@
+"""Profiling a command, deterministically or by sampling
+
+Copyright 2018 iRobot Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from __future__ import absolute_import, print_function
+
+import six
+import collections
+import cProfile
+import os.path
+import pstats
+import sys
+import threading
+
+DETERMINISTIC = 'deterministic'
+SAMPLING = 'sampling'
+MODES = [DETERMINISTIC, SAMPLING]
+
+TOP = 20
+
+class DeterministicProfiler(object):
+    """cProfile for the calling thread and every thread started while it runs
+    (the thread pools), merged into a single pstats file."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profilers = []
+
+    def _profile_thread(self, *args):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Since Python 3.12, a profiler covers every thread and only one can be active
+            return
+        with self._lock:
+            self._profilers.append(profiler)
+
+    def start(self):
+        profiler = cProfile.Profile()
+        self._profilers.append(profiler)
+        threading.setprofile(self._profile_thread)
+        profiler.enable()
+
+    def stop(self):
+        self._profilers[0].disable()
+        threading.setprofile(None)
+
+    def stats(self, stream=None):
+        with self._lock:
+            profilers = list(self._profilers)
+        stats = pstats.Stats(profilers[0], stream=stream)
+        for profiler in profilers[1:]:
+            stats.add(profiler)
+        return stats
+
+    def save(self, file_name):
+        self.stats().dump_stats(file_name)
+
+    def print_top(self, stream, top=TOP):
+        self.stats(stream=stream).sort_stats('tottime').print_stats(top)
+
+class SamplingProfiler(object):
+    """Samples the stacks of all threads every interval seconds. The result is in
+    the collapsed stack format used by flamegraph.pl and speedscope."""
+
+    INTERVAL = 0.005
+
+    def __init__(self, interval=None):
+        self.interval = interval or self.INTERVAL
+        self.samples = collections.Counter()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def _label(cls, code):
+        return '{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+    def _sample(self):
+        own_ident = threading.current_thread().ident
+        for ident, frame in six.iteritems(sys._current_frames()):
+            if ident == own_ident:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            self.samples[tuple(reversed(stack))] += 1
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='SamplingProfiler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return ['{} {}'.format(';'.join(stack), count) for stack, count in sorted(six.iteritems(self.samples))]
+
+    def save(self, file_name):
+        with open(file_name, 'w') as fp:
+            for line in self.collapsed():
+                fp.write(line + '\n')
+
+    def print_top(self, stream, top=TOP):
+        total = sum(six.itervalues(self.samples))
+        if not total:
+            stream.write('No samples\n')
+            return
+        own = collections.Counter()
+        inclusive = collections.Counter()
+        for stack, count in six.iteritems(self.samples):
+            own[stack[-1]] += count
+            for label in set(stack):
+                inclusive[label] += count
+        stream.write('{} samples every {:.1f} ms\n'.format(total, self.interval * 1000))
+        stream.write('{:>7} {:>7}  {}\n'.format('SELF', 'TOTAL', 'FUNCTION'))
+        for label, count in own.most_common(top):
+            stream.write('{:>6.1f}% {:>6.1f}%  {}\n'.format(
+                100.0 * count / total, 100.0 * inclusive[label] / total, label))
+
+PROFILERS = {
+    DETERMINISTIC: DeterministicProfiler,
+    SAMPLING: SamplingProfiler,
+}
+
+def default_file_name(command, mode):
+    return 'ssm-ctl-{}.{}'.format(command, 'pstats' if mode == DETERMINISTIC else 'collapsed')
+
+def run_profiled(func, file_name, mode=DETERMINISTIC, stream=None, top=TOP):
+    """Call func under the profiler for the mode, then save the profile to file_name and
+    print the top functions to stream (default stderr), even if func raises."""
+    if stream is None:
+        stream = sys.stderr
+    profiler = PROFILERS[mode]()
+    profiler.start()
+    try:
+        return func()
+    finally:
+        profiler.stop()
+        profiler.save(file_name)
+        stream.write('Wrote {} profile to {}\n'.format(mode, file_name))
+        profiler.print_top(stream, top=top)
@@ -0,0 +1,162 @@
+"""Rate limiting for SSM API calls
+
+Copyright 2018 iRobot Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from __future__ import absolute_import, print_function
+
+import collections
+import threading
+import time
+
+_clock = getattr(time, 'monotonic', time.time)
+
+class TokenBucket(object):
+    """Thread-safe token bucket.
+    :param rate: Tokens added per second. None means unlimited.
+    :param capacity: Maximum number of tokens that can accumulate (the burst size).
+        Defaults to the rate, i.e., one second's worth of tokens.
+    """
+
+    def __init__(self, rate=None, capacity=None):
+        self._lock = threading.Lock()
+        self._rate = None
+        self._capacity = None
+        self._tokens = float('inf')
+        self._last = _clock()
+        self.set_rate(rate, capacity=capacity)
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def set_rate(self, rate, capacity=None):
+        with self._lock:
+            self._refill()
+            self._rate = float(rate) if rate else None
+            if capacity is None and self._rate is not None:
+                capacity = max(self._rate, 1.0)
+            self._capacity = float(capacity) if capacity else None
+            if self._capacity is not None:
+                self._tokens = min(self._tokens, self._capacity)
+
+    def _refill(self):
+        now = _clock()
+        if self._rate is not None:
+            self._tokens = min(self._capacity, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+    def try_acquire(self, tokens=1):
+        """Take the given number of tokens if they are available, without blocking.
+        Returns True if they were taken."""
+        with self._lock:
+            if self._rate is None:
+                return True
+            self._refill()
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def reserve(self, tokens=1):
+        """Take the given number of tokens without blocking, going into debt if there
+        aren't enough, and return the number of seconds to wait before using them.
+        This lets callers that can't block (e.g., coroutines) wait in their own way."""
+        with self._lock:
+            if self._rate is None:
+                return 0
+            self._refill()
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self._rate
+
+    def acquire(self, tokens=1):
+        """Block until the given number of tokens is available, then take them."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+class AdaptiveRateLimiter(object):
+    """Additive-increase/multiplicative-decrease rate controller shared by API calls.
+    The rate starts out unlimited (or at initial_rate). On the first throttle, it is set to
+    the rate observed over the last second, scaled down by decrease; every subsequent
+    throttle scales it down again, at most once per cooldown seconds so that a burst of
+    throttles from concurrent calls counts once. Each successful call raises the rate
+    by increase/rate, i.e., by about increase calls per second every second.
+    """
+
+    def __init__(self, initial_rate=None, min_rate=1.0, max_rate=None,
+                 increase=1.0, decrease=0.5, cooldown=1.0):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+
+        self._bucket = TokenBucket(initial_rate, capacity=1)
+        self._lock = threading.Lock()
+        self._recent = collections.deque()
+        self._last_decrease = None
+
+        self.calls = 0
+        self.throttles = 0
+
+    @property
+    def rate(self):
+        return self._bucket.rate
+
+    def reserve(self):
+        """Reserve a call without blocking; returns the number of seconds to wait before making it."""
+        wait = self._bucket.reserve()
+        now = _clock() + wait
+        with self._lock:
+            self.calls += 1
+            self._recent.append(now)
+            while self._recent and self._recent[0] < now - 1.0:
+                self._recent.popleft()
+        return wait
+
+    def acquire(self):
+        self._bucket.acquire()
+        now = _clock()
+        with self._lock:
+            self.calls += 1
+            self._recent.append(now)
+            while self._recent and self._recent[0] < now - 1.0:
+                self._recent.popleft()
+
+    def on_success(self):
+        with self._lock:
+            rate = self._bucket.rate
+            if rate is None:
+                return
+            rate += self.increase / rate
+            if self.max_rate:
+                rate = min(rate, self.max_rate)
+            self._bucket.set_rate(rate, capacity=1)
+
+    def on_throttle(self):
+        now = _clock()
+        with self._lock:
+            self.throttles += 1
+            if self._last_decrease is not None and now - self._last_decrease < self.cooldown:
+                return
+            self._last_decrease = now
+            rate = self._bucket.rate
+            if rate is None:
+                rate = float(len(self._recent))
+            rate = max(self.min_rate, rate * self.decrease)
+            self._bucket.set_rate(rate, capacity=1)
@@ -0,0 +1,156 @@
+"""On-disk snapshots of the parameters on a path
+
+Copyright 2018 iRobot Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from __future__ import absolute_import, print_function
+
+import six
+import os
+import os.path
+import collections
+import calendar
+import datetime
+import hashlib
+import json
+import time
+
+from .ssm import ParameterMetadata
+from .diskcache import DiskCache, get_cache_dir
+
+SnapshotEntry = collections.namedtuple('SnapshotEntry', ['name', 'type', 'version', 'last_modified_date', 'value_hash'])
+
+def _dump_date(value):
+    if isinstance(value, datetime.datetime):
+        return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+    return value
+
+def _load_date(value):
+    if value is None:
+        return None
+    from dateutil import tz
+    return datetime.datetime.fromtimestamp(value, tz.tzutc())
+
+class Snapshot(object):
+    """The remote state of the parameters on a path: name, type, version, last modified date,
+    and a hash of the value and attributes (see SSMParameter.content_hash) where it is known."""
+
+    def __init__(self, account, region, path, entries=None, taken_at=None):
+        self.account = account
+        self.region = region
+        self.path = path
+        self.entries = entries if entries is not None else {}
+        self.taken_at = taken_at
+
+    @property
+    def age(self):
+        if self.taken_at is None:
+            return None
+        return time.time() - self.taken_at
+
+    def metadata(self):
+        return [ParameterMetadata(e.name, e.type, e.version, e.last_modified_date)
+                for e in sorted(six.itervalues(self.entries))]
+
+    def update(self, metadata):
+        """Replace the entries with a fresh listing. Value hashes are kept for parameters
+        whose version hasn't changed. Returns the names that are new or changed."""
+        changed = []
+        entries = {}
+        for m in metadata:
+            entry = self.entries.get(m.name)
+            value_hash = None
+            if entry and entry.version == m.version:
+                value_hash = entry.value_hash
+            else:
+                changed.append(m.name)
+            entries[m.name] = SnapshotEntry(m.name, m.type, m.version, m.last_modified_date, value_hash)
+        self.entries = entries
+        self.taken_at = time.time()
+        return changed
+
+    def set_hash(self, name, version, value_hash, type=None):
+        entry = self.entries.get(name)
+        if entry is None:
+            entry = SnapshotEntry(name, type, version, None, value_hash)
+        self.entries[name] = entry._replace(version=version, value_hash=value_hash)
+
+    def dump(self):
+        return {
+            'Account': self.account,
+            'Region': self.region,
+            'Path': self.path,
+            'TakenAt': self.taken_at,
+            'Entries': [[e.name, e.type, e.version, _dump_date(e.last_modified_date), e.value_hash]
+                        for e in six.itervalues(self.entries)],
+        }
+
+    @classmethod
+    def load(cls, data):
+        entries = {}
+        for name, type, version, last_modified_date, value_hash in data['Entries']:
+            entries[name] = SnapshotEntry(name, type, version, _load_date(last_modified_date), value_hash)
+        return cls(data['Account'], data['Region'], data['Path'], entries=entries, taken_at=data['TakenAt'])
+
+class SnapshotCache(DiskCache):
+    """A directory of Snapshots keyed by account, region, and path.
+    :param trust_age: Snapshots younger than this many seconds are used as-is; older ones
+        are revalidated with a metadata-only listing. None always revalidates.
+    :param max_age: Snapshots older than this many seconds are evicted.
+    :param max_bytes: The oldest snapshots are evicted to keep the cache under this size.
+    """
+    SUFFIX = '.json'
+    DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+    def __init__(self, directory=None, trust_age=None, max_age=None, max_bytes=None):
+        super(SnapshotCache, self).__init__(directory or get_cache_dir('snapshots'), max_age=max_age, max_bytes=max_bytes)
+        self.trust_age = trust_age
+        self._salt = None
+
+    @property
+    def salt(self):
+        """A random per-cache salt for value hashes, so the hashes of low-entropy
+        secrets can't be looked up without access to the cache."""
+        if self._salt is None:
+            self._ensure_directory()
+            path = os.path.join(self.directory, 'salt')
+            if not os.path.exists(path):
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, 'w') as fp:
+                    fp.write(hashlib.sha256(os.urandom(32)).hexdigest())
+            with open(path) as fp:
+                self._salt = fp.read().strip()
+        return self._salt
+
+    def _snapshot_file(self, account, region, path):
+        return self._file(hashlib.sha256(json.dumps([account, region, path]).encode('utf-8')).hexdigest())
+
+    def load(self, account, region, path):
+        """Get the Snapshot for the account, region, and path, or an empty Snapshot
+        if there is none or it has expired."""
+        file_name = self._snapshot_file(account, region, path)
+        try:
+            with open(file_name) as fp:
+                snapshot = Snapshot.load(json.load(fp))
+        except (IOError, OSError, ValueError, KeyError):
+            return Snapshot(account, region, path)
+        if snapshot.age is None or snapshot.age > self.max_age:
+            return Snapshot(account, region, path)
+        return snapshot
+
+    def save(self, snapshot):
+        self._write(self._snapshot_file(snapshot.account, snapshot.region, snapshot.path),
+                    lambda fp: json.dump(snapshot.dump(), fp))
@@ -20,251 +20,945 @@ from __future__ import absolute_import, print_function
 import six
 import base64
 import collections
+import hashlib
+import random
+import string
+import threading
+import time
 
 from . import util
+from . import trace
+from .rate import TokenBucket, AdaptiveRateLimiter, _clock
+from . import pathindex
+from .pathindex import PathIndex, REMOTE
 
-PathDiff = collections.namedtuple('PathDiff', ['add', 'overwrite', 'remove'])
+# PathDiff used to be defined here; keep ssm.PathDiff working for existing imports
+PathDiff = pathindex.PathDiff
+
+PutResult = collections.namedtuple('PutResult', ['name', 'response', 'error'])
+
+ParameterMetadata = collections.namedtuple('ParameterMetadata', ['name', 'type', 'version', 'last_modified_date'])
+
+DataKeyCacheConfig = collections.namedtuple('DataKeyCacheConfig', ['max_age', 'max_messages', 'max_bytes', 'capacity'])
+
+class DecryptCache(object):
+    """Memo of decrypted values, keyed by the sha256 digest of the ciphertext, so that each
+    distinct ciphertext is decrypted once. A decrypt of a ciphertext that is already being
+    decrypted in another thread waits for that result instead of making its own call.
+    Plaintexts are held in bytearrays, which clear() overwrites with zeros; the copies
+    returned to callers are ordinary strings."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+    
+    @classmethod
+    def _digest(cls, ciphertext):
+        if isinstance(ciphertext, six.text_type):
+            ciphertext = ciphertext.encode('utf-8')
+        return hashlib.sha256(ciphertext).hexdigest()
+    
+    def get(self, ciphertext, decrypt):
+        """Get the plaintext for the ciphertext, calling decrypt(ciphertext) on a miss"""
+        key = self._digest(ciphertext)
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self.hits += 1
+                    is_text, value = self._entries[key]
+                    return value.decode('utf-8') if is_text else bytes(value)
+                event = self._pending.get(key)
+                if event is None:
+                    event = self._pending[key] = threading.Event()
+                    self.misses += 1
+                    break
+            event.wait()
+        try:
+            plaintext = decrypt(ciphertext)
+            is_text = isinstance(plaintext, six.text_type)
+            value = bytearray(plaintext.encode('utf-8') if is_text else plaintext)
+            with self._lock:
+                self._entries[key] = (is_text, value)
+            return plaintext
+        finally:
+            with self._lock:
+                del self._pending[key]
+            event.set()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def clear(self):
+        """Zero and drop the cached plaintexts"""
+        with self._lock:
+            for _, value in six.itervalues(self._entries):
+                value[:] = bytearray(len(value))
+            self._entries.clear()
+
+class _CallAttempts(object):
+    """The retries of one API call, for the retry loops of SSMClient._call() and
+    AsyncSSMClient._call(). Throttles slow down the rate limiter; throttles and transient
+    errors (see SSMClient._is_transient()) are retried with jittered exponential backoff,
+    up to MAX_ATTEMPTS. The call is recorded in stats, if given."""
+    
+    def __init__(self, client, limiter, stats, operation, kwargs):
+        self.client = client
+        self.limiter = limiter
+        self.stats = stats
+        self.operation = operation
+        self.kwargs = kwargs
+        self.start = _clock()
+        self.attempt = 0
+        self.throttles = 0
+    
+    def retry_delay(self, e):
+        """The seconds to wait before retrying after the error, or None to raise it"""
+        self.attempt += 1
+        throttled = self.client._is_throttle(e)
+        if throttled:
+            self.throttles += 1
+        if (not throttled and not self.client._is_transient(e)) or self.attempt >= self.client.MAX_ATTEMPTS:
+            if self.stats is not None:
+                self.stats.record('ssm', self.operation, _clock() - self.start, error=True,
+                                  retries=self.attempt - 1, throttles=self.throttles,
+                                  sent=self.kwargs)
+            return None
+        if throttled:
+            self.limiter.on_throttle()
+        return random.uniform(0, min(self.client.MAX_BACKOFF, 0.05 * 2 ** self.attempt))
+    
+    def succeeded(self, response):
+        self.limiter.on_success()
+        if self.stats is not None:
+            self.stats.record('ssm', self.operation, _clock() - self.start,
+                              retries=self.attempt, throttles=self.throttles,
+                              sent=self.kwargs, received=response)
+
+class clientmethod(object):
+    """Decorator for SSMClient methods. Called on an instance, the method is bound to that
+    instance; called on the class, it is bound to the default instance, SSMClient.default().
+    This keeps SSMClient.get_path(...) etc. working while allowing independent clients.
+    On a class without a default instance (e.g., AsyncSSMClient), it is the plain function."""
+    
+    def __init__(self, func):
+        self.__func__ = func
+        self.__doc__ = func.__doc__
+        self.__name__ = func.__name__
+    
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            if not hasattr(cls, 'default'):
+                return self.__func__
+            obj = cls.default()
+        return self.__func__.__get__(obj, type(obj))
 
 class SSMClient(object):
-    """Client for SSM Parameter store, and crypto"""
+    """Client for SSM Parameter store, and crypto.
+    Each instance has its own session, client, rate limiter, and key provider, and is
+    safe to share between threads. Methods called on the class use the default instance.
+    
+    The factories and crypto hooks (SESSION_FACTORY, CLIENT_FACTORY, _ENCRYPTER, _DECRYPTER)
+    can be set on the class or on an instance, and are called as SESSION_FACTORY(),
+    CLIENT_FACTORY(session, name), _ENCRYPTER(plaintext, key_id), and _DECRYPTER(ciphertext).
+    Only the built-in defaults (which are clientmethods) are bound to the client.
+    A session or SSM client given to the constructor is used instead of the factory.
+    """
+    
+    _DEFAULT = None
+    _DEFAULT_LOCK = threading.Lock()
     
     @classmethod
-    def _default_session_factory(cls):
+    def default(cls):
+        """The instance used when methods are called on the class"""
+        if cls._DEFAULT is None:
+            with cls._DEFAULT_LOCK:
+                if cls._DEFAULT is None:
+                    cls._DEFAULT = cls()
+        return cls._DEFAULT
+    
+    @classmethod
+    def set_default(cls, client):
+        """Set the default instance; None resets it to be created on next use."""
+        cls._DEFAULT = client
+    
+    def __init__(self, region_name=None, profile_name=None, session=None, client=None):
+        self.region_name = region_name
+        self.profile_name = profile_name
+        
+        self._lock = threading.RLock()
+        self._boto_session = session
+        self._ssm_client = client
+        self._region = None
+        self._account = None
+        self._rate_limiter = None
+        self._snapshots = {}
+        self._master_key_provider = None
+        self._master_keys = set()
+        self._data_key_cache = None
+        self._crypto_cache = None
+        self._materials_managers = {}
+        self._reencrypt_keys = []
+        self._describe_denied = False
+    
+    @clientmethod
+    def _default_session_factory(self):
         """Default session factory that creates a boto3 session."""
         import boto3
-        return boto3.session.Session()
+        return boto3.session.Session(region_name=self.region_name, profile_name=self.profile_name)
 
-    @classmethod
-    def _default_client_factory(cls, session, name):
-        """Default client factory that creates a client from the provided session."""
-        return session.client(name)
+    @clientmethod
+    def _default_client_factory(self, session, name):
+        """Default client factory that creates a client from the provided session.
+        botocore's own retries are turned off; throttles and transient errors are retried
+        by _call(), which adapts the request rate to the throttles."""
+        from botocore.config import Config
+        return session.client(name, config=Config(retries={'max_attempts': 0}))
 
     SESSION_FACTORY = _default_session_factory
     CLIENT_FACTORY = _default_client_factory
 
-    _SESSION = None
-    _CLIENT = None
+    @clientmethod
+    def _hook(self, name):
+        """The named factory or crypto hook, without binding it to the client unless it is
+        a clientmethod (like the defaults), classmethod, or staticmethod."""
+        if name in self.__dict__:
+            return self.__dict__[name]
+        for cls in type(self).__mro__:
+            if name in cls.__dict__:
+                hook = cls.__dict__[name]
+                if isinstance(hook, (clientmethod, classmethod, staticmethod)):
+                    return hook.__get__(self, type(self))
+                return hook
+        return None
 
-    @classmethod
-    def _session(cls):
+    @clientmethod
+    def _session(self):
         """Use the defined session factory to create an object that acts like a boto3 session.
         Defaults to boto3.session.Session(); set SESSION_FACTORY to inject a different session
         factory.
         You should not need to call this method yourself; it is meant for internal use."""
-        if cls._SESSION is None:
-            if cls.SESSION_FACTORY:
-                cls._SESSION = cls.SESSION_FACTORY()
-            else:
-                cls._SESSION = cls._default_session_factory()
-        return cls._SESSION
+        with self._lock:
+            if self._boto_session is None:
+                session_factory = self._hook('SESSION_FACTORY')
+                if session_factory:
+                    self._boto_session = session_factory()
+                else:
+                    self._boto_session = self._default_session_factory()
+            return self._boto_session
 
-    @classmethod
-    def _client(cls):
+    @clientmethod
+    def _client(self):
         """Use the defined client factory to create an object that acts like a boto3 client.
         Defaults to _session().client("ssm"); set CLIENT_FACTORY to inject a different client
         factory."""
-        if cls._CLIENT is None:
-            if cls.CLIENT_FACTORY:
-                client = cls.CLIENT_FACTORY(cls._session(), "ssm")
-            else:
-                client = cls._default_client_factory(cls._session(), "ssm")
-            cls._CLIENT = client
-        return cls._CLIENT
-    
-    _REGION = None
-    _ACCOUNT = None
+        with self._lock:
+            if self._ssm_client is None:
+                client_factory = self._hook('CLIENT_FACTORY')
+                if client_factory:
+                    client = client_factory(self._session(), "ssm")
+                else:
+                    client = self._default_client_factory(self._session(), "ssm")
+                self._ssm_client = client
+            return self._ssm_client
     
-    @classmethod
-    def get_region(cls):
+    @clientmethod
+    def get_region(self):
         """Get the region from the session"""
-        if not cls._REGION:
-            cls._REGION = cls._session().region_name
-        return cls._REGION
+        if not self._region:
+            self._region = self.region_name or self._session().region_name
+        return self._region
     
-    @classmethod
-    def get_account(cls):
+    @clientmethod
+    def get_account(self):
         """Call STS.GetCallerIdentity (using the session) to get the current account"""
-        if not cls._ACCOUNT:
-            cls._ACCOUNT = cls._session().client('sts').get_caller_identity()['Account']
-        return cls._ACCOUNT   
+        with self._lock:
+            if not self._account:
+                start = _clock()
+                response = self._session().client('sts').get_caller_identity()
+                if self.STATS is not None:
+                    self.STATS.record('sts', 'get_caller_identity', _clock() - start,
+                                      received=response)
+                self._account = response['Account']
+            return self._account
+    
+    THROTTLE_ERROR_CODES = frozenset([
+        'ThrottlingException',
+        'Throttling',
+        'TooManyUpdates',
+        'RequestLimitExceeded',
+    ])
+    TRANSIENT_ERROR_CODES = frozenset([
+        'InternalServerError',
+        'InternalFailure',
+        'ServiceUnavailable',
+        'RequestTimeout',
+        'RequestTimeoutException',
+    ])
+    MAX_ATTEMPTS = 10
+    MAX_BACKOFF = 5.0
+    
+    # A stats.Stats shared by all clients, recording each API call and encrypt/decrypt
+    STATS = None
+    
+    @clientmethod
+    def rate_limiter(self):
+        """The AdaptiveRateLimiter that all SSM API calls from this client draw from."""
+        with self._lock:
+            if self._rate_limiter is None:
+                self._rate_limiter = AdaptiveRateLimiter()
+            return self._rate_limiter
+    
+    @classmethod
+    def _is_throttle(cls, e):
+        response = getattr(e, 'response', None)
+        if not isinstance(response, dict):
+            return False
+        return response.get('Error', {}).get('Code') in cls.THROTTLE_ERROR_CODES
     
     @classmethod
-    def batch_put(cls, parameters, dumper=None):
-        """Store the given parameters in SSM"""
+    def _is_transient(cls, e):
+        """Check if the error is a server error, timeout, or connection error, which
+        botocore would have retried (its retries are turned off, see _call())"""
+        response = getattr(e, 'response', None)
+        if isinstance(response, dict):
+            if response.get('Error', {}).get('Code') in cls.TRANSIENT_ERROR_CODES:
+                return True
+            return response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500
+        try:
+            from botocore.exceptions import ConnectionError, HTTPClientError
+        except ImportError:
+            return False
+        return isinstance(e, (ConnectionError, HTTPClientError))
+    
+    @clientmethod
+    def _call(self, operation, **kwargs):
+        """Call the given SSM client operation through the shared rate limiter,
+        retrying with backoff when throttled or on a transient error (see _CallAttempts)."""
+        method = getattr(self._client(), operation)
+        limiter = self.rate_limiter()
+        attempts = _CallAttempts(self, limiter, self.STATS, operation, kwargs)
+        while True:
+            limiter.acquire()
+            try:
+                response = method(**kwargs)
+            except Exception as e:
+                delay = attempts.retry_delay(e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            attempts.succeeded(response)
+            return response
+    
+    @clientmethod
+    def _paginate(self, operation, **kwargs):
+        """Yield each page of the given SSM client operation, calling it through _call()"""
+        while True:
+            response = self._call(operation, **kwargs)
+            yield response
+            next_token = response.get('NextToken')
+            if not next_token:
+                break
+            kwargs['NextToken'] = next_token
+    
+    PUT_CONCURRENCY = 4
+    PUT_RATE = None
+
+    @clientmethod
+    def batch_put(self, parameters, dumper=None, concurrency=None, rate=None):
+        """Store the given parameters in SSM.
+        Puts are made from a pool of concurrency threads (default PUT_CONCURRENCY),
+        sharing a token bucket that limits them to rate calls per second (default PUT_RATE,
+        None for unlimited), with no burst above the rate.
+        Returns a list of PutResults in the order of the parameters; parameters for which
+        the dumper returns nothing are skipped. A failed put does not stop the others;
+        its exception is stored in the result."""
         if not dumper:
             dumper = lambda o: o
-        client = cls._client()
-        responses = []
-        for parameter_batch in util.batch(parameters, 10):
-            for parameter in parameter_batch:
-                kwargs = dumper(parameter)
-                if not kwargs:
-                    continue
-                
-                response = client.put_parameter(
-                    **kwargs
-                    )
-                responses.append(response)
+        if concurrency is None:
+            concurrency = self.PUT_CONCURRENCY
+        if rate is None:
+            rate = self.PUT_RATE
+        # No burst, so the first second doesn't get up to twice the rate
+        bucket = TokenBucket(rate, capacity=1)
+
+        def put(parameter):
+            kwargs = dumper(parameter)
+            if not kwargs:
+                return None
+            bucket.acquire()
+            with trace.span('put_parameter', parameter=kwargs['Name']):
+                try:
+                    response = self._call('put_parameter',
+                        **kwargs
+                        )
+                except Exception as e:
+                    return PutResult(kwargs['Name'], None, e)
+            return PutResult(kwargs['Name'], response, None)
+
+        with trace.span('batch_put', concurrency=concurrency):
+            results = util.concurrent_map(put, parameters, concurrency)
+        return [result for result in results if result is not None]
     
-    @classmethod
-    def _load_parameters_from_response(cls, response, loader, reencrypt, limit=None, base_path=None):
+    REENCRYPT_CONCURRENCY = 8
+    
+    @clientmethod
+    def _load_parameters_from_response(self, response, loader, reencrypt, limit=None, base_path=None):
+        """Load the items in the response, after reencrypting the SecureStrings using
+        REENCRYPT_CONCURRENCY threads. The parameters are in the order of the items."""
         if not loader:
-            loader = lambda o: o
-        parameters = []
-        for i, item in enumerate(response['Parameters']):
-            if limit is not None and i > limit:
-                break
-            # Encrypted SecureStrings aren't in AWS Encryption SDK format, so reencrypt them with it
-            if reencrypt and item['Type'] == 'SecureString':
-                key_id = cls._get_reencrypt_key(item['Name'], item['KeyId'])
-                item['EncryptedValue'] = SSMClient.encrypt(item.pop('Value'), key_id)
-            parameter = loader(item, base_path)
-            parameters.append(parameter)
-        return parameters
+            loader = lambda o, base_path: o
+        items = response['Parameters']
+        if limit is not None:
+            items = items[:limit]
+        
+        # Encrypted SecureStrings aren't in AWS Encryption SDK format, so reencrypt them with it
+        def reencrypt_item(item):
+            key_id = self._get_reencrypt_key(item['Name'], item['KeyId'])
+            item['EncryptedValue'] = self.encrypt(item.pop('Value'), key_id)
+        
+        if reencrypt:
+            util.concurrent_map(reencrypt_item,
+                [item for item in items if item['Type'] == 'SecureString'],
+                self.REENCRYPT_CONCURRENCY)
+        return [loader(item, base_path) for item in items]
+    
+    GET_CONCURRENCY = 4
+    
+    _DESCRIBE_ATTRIBUTES = ['Description', 'AllowedPattern', 'KeyId', 'LastModifiedUser', 'Tier', 'Policies']
+    
+    @classmethod
+    def _is_access_denied(cls, e):
+        response = getattr(e, 'response', None)
+        if not isinstance(response, dict):
+            return False
+        return response.get('Error', {}).get('Code') in ('AccessDeniedException', 'AccessDenied')
     
     @classmethod
-    def get(cls, names, full=False, reencrypt=True, loader=None, base_path=None):
+    def _merge_attributes(cls, items, described_items):
+        """Add the attributes from DescribeParameters items to the GetParameters items"""
+        attributes = dict((item['Name'], item) for item in described_items)
+        for item in items:
+            description = attributes.get(item['Name'], {})
+            for key in cls._DESCRIBE_ATTRIBUTES:
+                if key in description:
+                    item.setdefault(key, description[key])
+        return items
+    
+    @clientmethod
+    def _get_full_batch(self, name_batch, decrypt):
+        """Get the latest value and attributes of up to 10 parameters.
+        GetParameters gives the value, and DescribeParameters the rest of the attributes.
+        If DescribeParameters is denied (it can't be limited to a path in IAM), each
+        parameter's latest version is read from GetParameterHistory instead.
+        Returns the merged items and the invalid names."""
+        if not self._describe_denied:
+            try:
+                described_items = [item
+                    for describe_response in self._paginate('describe_parameters',
+                        ParameterFilters=[{
+                            'Key': 'Name',
+                            'Option': 'Equals',
+                            'Values': name_batch,
+                        }])
+                    for item in describe_response['Parameters']]
+            except Exception as e:
+                if not self._is_access_denied(e):
+                    raise
+                self._describe_denied = True
+            else:
+                response = self._call('get_parameters',
+                    Names=name_batch,
+                    WithDecryption=decrypt)
+                return self._merge_attributes(response['Parameters'], described_items), response['InvalidParameters']
+        return self._get_latest_versions(name_batch, decrypt)
+    
+    @classmethod
+    def _merge_described(cls, items, described_items):
+        """Merge the attributes from DescribeParameters items into the GetParameters items for
+        them, in the order they were described. Parameters deleted in between are left out."""
+        items = dict((item['Name'], item) for item in cls._merge_attributes(items, described_items))
+        return [items[item['Name']] for item in described_items if item['Name'] in items]
+    
+    @clientmethod
+    def _get_described(self, described_items, decrypt, concurrency=None):
+        """Get the values of parameters already listed by DescribeParameters, in batches of 10
+        fetched using concurrency threads (default GET_CONCURRENCY), and merge the described
+        attributes into them (see _merge_described())."""
+        if concurrency is None:
+            concurrency = self.GET_CONCURRENCY
+        responses = util.concurrent_map(
+            lambda item_batch: self._call('get_parameters',
+                Names=[item['Name'] for item in item_batch],
+                WithDecryption=decrypt),
+            list(util.batch(described_items, 10)),
+            concurrency)
+        items = [item for response in responses for item in response['Parameters']]
+        return self._merge_described(items, described_items)
+    
+    @clientmethod
+    def _get_latest_versions(self, names, decrypt):
+        """Get the latest version of each parameter from its history, which has all the attributes.
+        Returns the items and the invalid names."""
+        items = []
+        invalid_names = []
+        for name in names:
+            latest = None
+            try:
+                for latest in self._iter_version_items(name, decrypt):
+                    pass
+            except Exception as e:
+                code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+                if code != 'ParameterNotFound':
+                    raise
+            if latest is None:
+                invalid_names.append(name)
+            else:
+                items.append(latest)
+        return items, invalid_names
+    
+    @clientmethod
+    def get(self, names, full=False, reencrypt=True, loader=None, base_path=None, concurrency=None):
         """Get the specified parameter(s).
         :param full: When False, get only the name, type, and value.
+            When True, also get the parameter attributes (description, allowed pattern, key id, etc.)
+            Batches are fetched using concurrency threads (default GET_CONCURRENCY).
         """
         if isinstance(names, six.string_types):
             names = [names]
+        if concurrency is None:
+            concurrency = self.GET_CONCURRENCY
         
         invalid_parameter_names = []
         parameters = []
         
         if full:
-            #TODO: catch exceptions, store as invalid
-            for name in names:
-                try:
-                    parameter_versions = cls.get_versions(name, reencrypt=reencrypt, limit=1, loader=loader, base_path=base_path)
-                except Exception as e:
-                    invalid_parameter_names.append(name)
-                parameters.append(parameter_versions[0])
+            batches = util.concurrent_map(
+                lambda name_batch: self._get_full_batch(name_batch, reencrypt),
+                list(util.batch(names, 10)),
+                concurrency)
+            for items, invalid_names in batches:
+                invalid_parameter_names.extend(invalid_names)
+                parameters.extend(self._load_parameters_from_response({'Parameters': items}, loader, reencrypt=reencrypt, base_path=base_path))
         else:
-            client = cls._client()
             for name_batch in util.batch(names, 10):
-                response = client.get_parameters(
+                response = self._call('get_parameters',
                     Names=name_batch,
                     WithDecryption=reencrypt)
                 invalid_parameter_names.extend(response['InvalidParameters'])
-                parameters.extend(cls._load_parameters_from_response(response, loader, reencrypt=reencrypt, base_path=base_path))
+                parameters.extend(self._load_parameters_from_response(response, loader, reencrypt=reencrypt, base_path=base_path))
         
         if invalid_parameter_names:
             raise KeyError("Invalid parameter names {}".format(', '.join(invalid_parameter_names)))
         return parameters
     
-    @classmethod
-    def get_versions(cls, name, reencrypt=True, limit=None, loader=None, base_path=None):
-        client = cls._client()
-        paginator = client.get_paginator('get_parameter_history')
-        parameter_versions = []
-        
-        for response in paginator.paginate(
+    @clientmethod
+    def get_current(self, names, concurrency=None):
+        """Get the current state of the given parameters as a dict of name to the item
+        returned by SSM, with decrypted values and all attributes.
+        Names that don't exist are left out."""
+        if concurrency is None:
+            concurrency = self.GET_CONCURRENCY
+        batches = util.concurrent_map(
+            lambda name_batch: self._get_full_batch(name_batch, True),
+            list(util.batch(list(names), 10)),
+            concurrency)
+        return dict((item['Name'], item) for items, _ in batches for item in items)
+    
+    @clientmethod
+    def _iter_version_items(self, name, decrypt, since=None, until=None, min_version=None, max_version=None):
+        """Yield the raw history items for the parameter, oldest first.
+        GetParameterHistory returns versions in ascending order, so pagination stops
+        as soon as an item past max_version or until is seen."""
+        for response in self._paginate('get_parameter_history',
                 Name=name,
-                WithDecryption=reencrypt):
-            load_limit = None
-            if limit is not None:
-                load_limit = limit - len(parameter_versions)
-            
-            parameter_versions.extend(cls._load_parameters_from_response(response, loader, reencrypt=reencrypt, limit=load_limit, base_path=base_path))
-        
-        parameter_versions.sort(key=lambda p: p.version, reverse=True)
-        return parameter_versions
+                WithDecryption=decrypt,
+                MaxResults=50):
+            for item in response['Parameters']:
+                if max_version is not None and item['Version'] > max_version:
+                    return
+                if until is not None and item['LastModifiedDate'] > until:
+                    return
+                if min_version is not None and item['Version'] < min_version:
+                    continue
+                if since is not None and item['LastModifiedDate'] < since:
+                    continue
+                yield item
+    
+    @clientmethod
+    def iter_versions(self, name, reencrypt=True, loader=None, base_path=None, limit=None,
+                      since=None, until=None, min_version=None, max_version=None):
+        """Yield versions of the parameter, oldest first, as they are fetched.
+        :param limit: Stop after this many versions.
+        :param since, until: Only versions last modified in this time window (datetimes).
+        :param min_version, max_version: Only versions in this range (inclusive).
+        No further pages are requested once limit, max_version, or until has been reached.
+        """
+        items = self._iter_version_items(name, reencrypt,
+            since=since, until=until, min_version=min_version, max_version=max_version)
+        for i, item in enumerate(items):
+            if limit is not None and i >= limit:
+                return
+            for parameter in self._load_parameters_from_response({'Parameters': [item]}, loader, reencrypt=reencrypt, base_path=base_path):
+                yield parameter
+    
+    @clientmethod
+    def get_versions(self, name, reencrypt=True, limit=None, loader=None, base_path=None,
+                     since=None, until=None, min_version=None, max_version=None):
+        """Get versions of the parameter, newest first.
+        :param limit: Only the newest limit versions.
+        The history has to be walked to the end to find the newest versions, but only those
+        that are returned are kept in memory and loaded (and reencrypted)."""
+        items = collections.deque(self._iter_version_items(name, reencrypt,
+            since=since, until=until, min_version=min_version, max_version=max_version),
+            maxlen=limit)
+        items.reverse()
+        return self._load_parameters_from_response({'Parameters': list(items)}, loader, reencrypt=reencrypt, base_path=base_path)
+    
+    SNAPSHOT_CACHE = None
+    
+    @clientmethod
+    def get_snapshot(self, path):
+        """Get the Snapshot of the path from SNAPSHOT_CACHE, revalidating it with a
+        metadata-only listing unless it is younger than the cache's trust_age."""
+        if path in self._snapshots:
+            return self._snapshots[path]
+        cache = self.SNAPSHOT_CACHE
+        snapshot = cache.load(self.get_account(), self.get_region(), path)
+        if cache.trust_age is None or snapshot.age is None or snapshot.age > cache.trust_age:
+            snapshot.update(self.list_path(path, use_snapshot=False))
+            cache.save(snapshot)
+        self._snapshots[path] = snapshot
+        return snapshot
+    
+    @clientmethod
+    def save_snapshots(self):
+        """Save the snapshots used in this run, which delete() and the caller may have updated"""
+        for snapshot in six.itervalues(self._snapshots):
+            self.SNAPSHOT_CACHE.save(snapshot)
+    
+    @clientmethod
+    def _uses_snapshot(self, recursive, parameter_filters):
+        return self.SNAPSHOT_CACHE is not None and recursive and not parameter_filters
     
     @classmethod
-    def get_path(cls, path, names_only=False, full=False, reencrypt=True, loader=None, recursive=True, parameter_filters=[]):
-        if names_only and full:
-            raise ValueError("Can't specify both names_only and full")
-        client = cls._client()
-        paginator = client.get_paginator('get_parameters_by_path')
-        names = []
-        parameters = []
-        
-        for response in paginator.paginate(
+    def _path_filters(cls, path, recursive, parameter_filters):
+        filters = [{
+            'Key': 'Path',
+            'Option': 'Recursive' if recursive else 'OneLevel',
+            'Values': [path or '/'],
+        }]
+        filters.extend(parameter_filters)
+        return filters
+    
+    @clientmethod
+    def list_path(self, path, recursive=True, parameter_filters=[], use_snapshot=True):
+        """List the parameters on the given path as ParameterMetadata tuples.
+        This uses GetParametersByPath without decryption, so no values are decrypted and
+        only permissions on the path (not DescribeParameters) are needed.
+        If SNAPSHOT_CACHE is set, recursive listings go through get_snapshot()."""
+        if use_snapshot and self._uses_snapshot(recursive, parameter_filters):
+            return self.get_snapshot(path).metadata()
+        metadata = []
+        for response in self._paginate('get_parameters_by_path',
                 Path=path,
                 Recursive=recursive,
                 ParameterFilters=parameter_filters,
-                WithDecryption=reencrypt):
-            if names_only or full:
-                names.extend(item['Name'] for item in response['Parameters'])
-            else:
-                parameters.extend(cls._load_parameters_from_response(response, loader, reencrypt=reencrypt, base_path=path))
-        
-        if names_only:
-            return names
-        elif full:
-            return cls.get(names, full=True, reencrypt=reencrypt, loader=loader, base_path=path)
-        else:
-            return parameters
+                WithDecryption=False,
+                MaxResults=10):
+            metadata.extend(self._metadata(response['Parameters']))
+        return metadata
     
     @classmethod
-    def diff_path(cls, path, names):
-        names_on_path = set(name for name in names if name.startswith(path))
-        path_names = set(cls.get_path(path, names_only=True))
-        add = names_on_path - path_names
-        overwrite = names_on_path & path_names
-        remove = path_names - names_on_path
-        return PathDiff(sorted(add), sorted(overwrite), sorted(remove))
+    def _metadata(cls, items):
+        return [ParameterMetadata(
+            item['Name'],
+            item.get('Type'),
+            item.get('Version'),
+            item.get('LastModifiedDate'),
+            ) for item in items]
     
     @classmethod
-    def diff_paths(cls, paths, names):
-        names = set(names)
-        add = set()
-        overwrite = set()
-        remove = set()
-        for path in paths:
-            names_on_path = set(name for name in names if name.startswith(path))
-            path_names = set(cls.get_path(path, names_only=True))
-            add |= (names_on_path - path_names)
-            overwrite |= (names_on_path & path_names)
-            remove |= (path_names - names_on_path)
-        add |= (names - overwrite - remove)
-        return PathDiff(sorted(add), sorted(overwrite), sorted(remove))
+    def _prefix_filters(cls, prefix, parameter_filters):
+        filters = [{
+            'Key': 'Name',
+            'Option': 'BeginsWith',
+            'Values': [prefix],
+        }]
+        filters.extend(parameter_filters)
+        return filters
     
-    @classmethod
-    def delete(cls, names):
+    @clientmethod
+    def list_prefix(self, prefix, parameter_filters=[]):
+        """List the parameters whose names begin with the prefix as ParameterMetadata tuples"""
+        metadata = []
+        for response in self._paginate('describe_parameters',
+                ParameterFilters=self._prefix_filters(prefix, parameter_filters),
+                MaxResults=50):
+            metadata.extend(self._metadata(response['Parameters']))
+        return metadata
+    
+    PAGE_SIZE = None
+    PREFETCH_PAGES = 2
+    
+    @clientmethod
+    def get_path(self, path, names_only=False, full=False, reencrypt=True, loader=None, recursive=True, parameter_filters=[],
+                 page_size=None, prefetch=None):
+        """Get the parameters on the path.
+        :param page_size: The number of parameters to request per page (MaxResults, up to 10,
+            or 50 with full); default PAGE_SIZE, None for the service default (or 50 with full).
+        :param prefetch: The number of pages to fetch in a background thread ahead of the
+            pages being loaded (default PREFETCH_PAGES), so that fetching overlaps with
+            loading and reencryption. 0 fetches each page after the previous one is loaded.
+        With full, the pages of DescribeParameters are prefetched instead, and the values for
+        each page are fetched as it arrives and merged with the described attributes."""
+        if names_only and full:
+            raise ValueError("Can't specify both names_only and full")
+        if page_size is None:
+            page_size = self.PAGE_SIZE
+        if prefetch is None:
+            prefetch = self.PREFETCH_PAGES
+        
+        if names_only:
+            return [m.name for m in self.list_path(path, recursive=recursive, parameter_filters=parameter_filters)]
+        
+        parameters = []
+        if full:
+            if not self._describe_denied:
+                pages = self._paginate('describe_parameters',
+                    ParameterFilters=self._path_filters(path, recursive, parameter_filters),
+                    MaxResults=page_size or 50)
+                try:
+                    for response in util.prefetch(pages, prefetch):
+                        items = self._get_described(response['Parameters'], reencrypt)
+                        parameters.extend(self._load_parameters_from_response({'Parameters': items}, loader, reencrypt=reencrypt, base_path=path))
+                    return parameters
+                except Exception as e:
+                    if parameters or not self._is_access_denied(e):
+                        raise
+                    self._describe_denied = True
+            names = [m.name for m in self.list_path(path, recursive=recursive, parameter_filters=parameter_filters)]
+            return self.get(names, full=True, reencrypt=reencrypt, loader=loader, base_path=path)
+        
+        kwargs = {}
+        if page_size:
+            kwargs['MaxResults'] = page_size
+        pages = self._paginate('get_parameters_by_path',
+            Path=path,
+            Recursive=recursive,
+            ParameterFilters=parameter_filters,
+            WithDecryption=reencrypt,
+            **kwargs)
+        for response in util.prefetch(pages, prefetch):
+            parameters.extend(self._load_parameters_from_response(response, loader, reencrypt=reencrypt, base_path=path))
+        return parameters
+    
+    LIST_CONCURRENCY = 4
+    
+    @clientmethod
+    def list_paths(self, paths, recursive=True, parameter_filters=[], concurrency=None):
+        """List multiple paths in parallel, using concurrency threads (default LIST_CONCURRENCY).
+        For recursive listings, only the minimal set of paths covering the given paths is listed,
+        and the results are assigned back to each path.
+        Returns a dict of path to the list of ParameterMetadata on that path."""
+        if concurrency is None:
+            concurrency = self.LIST_CONCURRENCY
+        paths = list(paths)
+        # With a recursive listing, a path under another path doesn't need its own listing
+        list_paths = util.covering_paths(paths) if recursive else paths
+        results = util.concurrent_map(
+            lambda path: self.list_path(path, recursive=recursive, parameter_filters=parameter_filters),
+            list_paths,
+            concurrency)
+        return util.assign_listings(paths, dict(zip(list_paths, results)))
+    
+    @clientmethod
+    def get_paths(self, paths, full=False, reencrypt=True, loader=None, recursive=True, parameter_filters=[], concurrency=None,
+                  page_size=None, prefetch=None):
+        """Get the parameters on multiple paths in parallel, using concurrency threads
+        (default LIST_CONCURRENCY). The results are concatenated in the order of the paths.
+        page_size and prefetch are passed to get_path()."""
+        if concurrency is None:
+            concurrency = self.LIST_CONCURRENCY
+        results = util.concurrent_map(
+            lambda path: self.get_path(path, full=full, reencrypt=reencrypt, loader=loader,
+                                      recursive=recursive, parameter_filters=parameter_filters,
+                                      page_size=page_size, prefetch=prefetch),
+            list(paths),
+            concurrency)
+        return [parameter for parameters in results for parameter in parameters]
+    
+    SHARDS = 8
+    # The characters a parameter name can start with, after the path
+    NAME_CHARACTERS = string.ascii_letters + string.digits + '_.-'
+    
+    @clientmethod
+    def get_path_sharded(self, path, shards=None, reencrypt=True, loader=None, parameter_filters=[], concurrency=None):
+        """Get the parameters on the path (recursively) with their attributes, like get_path(full=True),
+        as shards that are listed and fetched in parallel using concurrency threads (default LIST_CONCURRENCY).
+        There is no API to list the subpaths of a path, so the shards are made by the first character
+        of the first-level subpath: each of the shards (default SHARDS) lists the names beginning with
+        its share of the possible prefixes, then fetches them. The results are merged in name order.
+        Each path takes at least len(NAME_CHARACTERS) DescribeParameters walks, and names that
+        share a first character are all in one shard."""
+        if shards is None:
+            shards = self.SHARDS
+        if shards < 1:
+            raise ValueError("shards must be at least 1, not {}".format(shards))
+        if concurrency is None:
+            concurrency = self.LIST_CONCURRENCY
+        prefixes = ['{}/{}'.format(path.rstrip('/'), c) for c in self.NAME_CHARACTERS]
+        shard_prefixes = [prefixes[i::shards] for i in range(min(shards, len(prefixes)))]
+        
+        def get_shard(prefixes):
+            items = []
+            for prefix in prefixes:
+                for response in self._paginate('describe_parameters',
+                        ParameterFilters=self._prefix_filters(prefix, parameter_filters),
+                        MaxResults=50):
+                    items.extend(self._get_described(response['Parameters'], reencrypt, concurrency=1))
+            return items
+        
+        items = {}
+        for shard_items in util.concurrent_map(get_shard, shard_prefixes, concurrency):
+            for item in shard_items:
+                items[item['Name']] = item
+        return self._load_parameters_from_response(
+            {'Parameters': [items[name] for name in sorted(items)]},
+            loader, reencrypt=reencrypt, base_path=path)
+    
+    @clientmethod
+    def index_paths(self, paths, names, concurrency=None):
+        """Build a PathIndex of the given (local) names and the remote names on the given paths"""
+        with trace.span('index_paths', paths=len(paths), names=len(names)):
+            index = PathIndex(local=names)
+            listings = self.list_paths(util.covering_paths(paths), concurrency=concurrency)
+            for metadata in six.itervalues(listings):
+                for m in metadata:
+                    index.add(m.name, REMOTE)
+        return index
+    
+    @clientmethod
+    def diff_path(self, path, names):
+        return self.index_paths([path], names).diff(path)
+    
+    @clientmethod
+    def diff_paths(self, paths, names, concurrency=None):
+        """Diff the names against the parameters on the paths.
+        Names that are not on any of the paths are always in the add list."""
+        with trace.span('diff_paths', paths=len(paths), names=len(names)):
+            return self.index_paths(paths, names, concurrency=concurrency).diff()
+    
+    @clientmethod
+    def delete(self, names):
         if isinstance(names, six.string_types):
             names = [names]
         
-        client = cls._client()
         responses = []
         for name_batch in util.batch(names, 10):
-            response = client.delete_parameters(Names=name_batch)
+            response = self._call('delete_parameters', Names=name_batch)
             responses.append(response)
+        
+        for snapshot in six.itervalues(self._snapshots):
+            for name in names:
+                snapshot.entries.pop(name, None)
     
-    @classmethod
-    def delete_path(cls, path, recursive=True, parameter_filters=[]):
-        names = cls.get_path(path, names_only=True, recursive=recursive, parameter_filters=parameter_filters)
-        return cls.delete(names)
+    @clientmethod
+    def delete_path(self, path, recursive=True, parameter_filters=[], keep=()):
+        """Delete the parameters on the path, except for the names in keep.
+        Returns the deleted names."""
+        index = PathIndex(local=keep,
+            remote=(m.name for m in self.list_path(path, recursive=recursive, parameter_filters=parameter_filters)))
+        names = index.diff(path).remove
+        self.delete(names)
+        return names
     
-    _MASTER_KEY_PROVIDER = None
-    _MASTER_KEYS = set()
+    @clientmethod
+    def set_data_key_cache(self, max_age, max_messages=None, max_bytes=None, capacity=None):
+        """Cache Encryption SDK data keys, so that a data key (and its KMS calls) is reused
+        across encrypt and decrypt calls. None turns caching off.
+        :param max_age: The number of seconds a data key is used for.
+        :param max_messages: The number of values a data key encrypts before it is replaced.
+        :param max_bytes: The number of bytes a data key encrypts before it is replaced.
+        :param capacity: The number of entries in the LRU cache (default DATA_KEY_CACHE_CAPACITY).
+        """
+        with self._lock:
+            self._materials_managers = {}
+            self._crypto_cache = None
+            if max_age is None:
+                self._data_key_cache = None
+            else:
+                self._data_key_cache = DataKeyCacheConfig(
+                    max_age, max_messages, max_bytes, capacity or self.DATA_KEY_CACHE_CAPACITY)
     
-    @classmethod
-    def get_master_key_provider(cls, key_id=None):
-        if not cls._MASTER_KEY_PROVIDER:
-            import aws_encryption_sdk
-            cls._MASTER_KEY_PROVIDER = aws_encryption_sdk.KMSMasterKeyProvider()
-        if key_id and key_id not in cls._MASTER_KEYS:
-            cls._MASTER_KEY_PROVIDER.add_master_key(key_id)
-            cls._MASTER_KEYS.add(key_id)
-        return cls._MASTER_KEY_PROVIDER
+    DATA_KEY_CACHE_CAPACITY = 100
     
-    @classmethod
-    def _default_encrypter(cls, plaintext, key_id):
+    @clientmethod
+    def get_materials_manager(self, key_id=None):
+        """The caching crypto materials manager for encrypting with key_id, or for decrypting
+        if key_id is None, or None if the data key cache is off (see set_data_key_cache()).
+        Each key id gets its own master key provider, so a cached data key is only ever reused
+        for the key it was created for."""
+        with self._lock:
+            config = self._data_key_cache
+            if config is None:
+                return None
+            if key_id not in self._materials_managers:
+                import aws_encryption_sdk
+                if self._crypto_cache is None:
+                    self._crypto_cache = aws_encryption_sdk.LocalCryptoMaterialsCache(config.capacity)
+                if key_id:
+                    provider = aws_encryption_sdk.KMSMasterKeyProvider(key_ids=[key_id])
+                else:
+                    provider = self.get_master_key_provider()
+                kwargs = {}
+                if config.max_messages is not None:
+                    kwargs['max_messages_encrypted'] = config.max_messages
+                if config.max_bytes is not None:
+                    kwargs['max_bytes_encrypted'] = config.max_bytes
+                self._materials_managers[key_id] = aws_encryption_sdk.CachingCryptoMaterialsManager(
+                    master_key_provider=provider,
+                    cache=self._crypto_cache,
+                    max_age=float(config.max_age),
+                    **kwargs)
+            return self._materials_managers[key_id]
+    
+    @clientmethod
+    def _crypto_materials(self, key_id=None):
+        """Keyword arguments for aws_encryption_sdk.encrypt/decrypt"""
+        materials_manager = self.get_materials_manager(key_id)
+        if materials_manager is not None:
+            return {'materials_manager': materials_manager}
+        return {'key_provider': self.get_master_key_provider(key_id)}
+    
+    @clientmethod
+    def get_master_key_provider(self, key_id=None):
+        with self._lock:
+            if not self._master_key_provider:
+                import aws_encryption_sdk
+                self._master_key_provider = aws_encryption_sdk.KMSMasterKeyProvider()
+            if key_id and key_id not in self._master_keys:
+                self._master_key_provider.add_master_key(key_id)
+                self._master_keys.add(key_id)
+            return self._master_key_provider
+    
+    @clientmethod
+    def _default_encrypter(self, plaintext, key_id):
         import aws_encryption_sdk
         ciphertext, _ = aws_encryption_sdk.encrypt(
                 source=plaintext,
-                key_provider=cls.get_master_key_provider(key_id))
+                **self._crypto_materials(key_id))
         return base64.b64encode(ciphertext)
     
-    @classmethod
-    def _default_decrypter(cls, ciphertext):
+    @clientmethod
+    def _default_decrypter(self, ciphertext):
         import aws_encryption_sdk
         plaintext, _ = aws_encryption_sdk.decrypt(
                 source=base64.b64decode(ciphertext),
-                key_provider=cls.get_master_key_provider())
+                **self._crypto_materials())
         return plaintext
     
     @classmethod
@@ -274,38 +968,62 @@ class SSMClient(object):
     _ENCRYPTER = _default_encrypter
     _DECRYPTER = _default_decrypter
     
-    @classmethod
-    def encrypt(cls, plaintext, key_id):
-        return cls._ENCRYPTER(plaintext, key_id) 
+    @clientmethod
+    def _timed(self, operation, func, data, *args):
+        """Call the crypto function, recording it in STATS if set"""
+        stats = self.STATS
+        if stats is None:
+            return func(data, *args)
+        start = _clock()
+        try:
+            result = func(data, *args)
+        except Exception:
+            stats.record('crypto', operation, _clock() - start, error=True, sent=data)
+            raise
+        stats.record('crypto', operation, _clock() - start,
+                     sent=data, received=result)
+        return result
     
-    @classmethod
-    def decrypt(cls, ciphertext):
-        return cls._DECRYPTER(ciphertext)
+    @clientmethod
+    def encrypt(self, plaintext, key_id):
+        return self._timed('encrypt', self._hook('_ENCRYPTER'), plaintext, key_id)
     
-    _REENCRYPT_KEYS = []
-    @classmethod
-    def set_reencrypt_key(cls, key_id, name_matcher=None):
+    DECRYPT_CACHE = None
+    
+    @clientmethod
+    def decrypt(self, ciphertext, key_id=None):
+        """Decrypt the ciphertext. The key is identified by the ciphertext itself;
+        key_id is accepted for symmetry with encrypt() and ignored.
+        If DECRYPT_CACHE (a DecryptCache, shared by all clients) is set, each distinct
+        ciphertext is only decrypted once."""
+        cache = self.DECRYPT_CACHE
+        if cache is None:
+            return self._timed('decrypt', self._hook('_DECRYPTER'), ciphertext)
+        return cache.get(ciphertext, lambda ciphertext: self._timed('decrypt', self._hook('_DECRYPTER'), ciphertext))
+    
+    @clientmethod
+    def set_reencrypt_key(self, key_id, name_matcher=None):
         if not name_matcher:
-            cls._REENCRYPT_KEYS = []
+            self._reencrypt_keys = []
             if key_id:
-                cls._REENCRYPT_KEYS = [(lambda name: True, key_id)]
+                self._reencrypt_keys = [(lambda name: True, key_id)]
         elif key_id:
-            cls._REENCRYPT_KEYS.append((name_matcher, key_id))
+            self._reencrypt_keys.append((name_matcher, key_id))
         else:
-            cls._REENCRYPT_KEYS.insert(0, (name_matcher, key_id))
+            self._reencrypt_keys.insert(0, (name_matcher, key_id))
     
-    @classmethod
-    def _get_reencrypt_key(cls, name, default_key_id):
-        for matcher, key_id in cls._REENCRYPT_KEYS:
+    @clientmethod
+    def _get_reencrypt_key(self, name, default_key_id):
+        for matcher, key_id in self._reencrypt_keys:
             if matcher(name):
                 return key_id
         return default_key_id
     
-    @classmethod
-    def format_key_id(cls, key_id):
+    @clientmethod
+    def format_key_id(self, key_id):
         if not key_id.startswith('arn'):
             key_id = 'arn:aws:kms:{}:{}:{}'.format(
-                SSMClient.get_region(),
-                SSMClient.get_account(),
+                self.get_region(),
+                self.get_account(),
                 key_id)
         return key_id
@@ -0,0 +1,244 @@
+"""Instrumentation of API calls and crypto operations
+
+Copyright 2018 iRobot Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from __future__ import absolute_import, print_function
+
+import six
+import bisect
+import json
+import os
+import os.path
+import socket
+import tempfile
+import threading
+import time
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+def size_of(obj):
+    """The approximate size in bytes of a request or response, as JSON"""
+    if obj is None:
+        return 0
+    if isinstance(obj, six.binary_type):
+        return len(obj)
+    if isinstance(obj, six.text_type):
+        return len(obj.encode('utf-8'))
+    return len(json.dumps(obj, default=str))
+
+class OperationStats(object):
+    """The counts, latency histogram, and bytes of one operation"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttles = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def record(self, seconds, error=False, retries=0, throttles=0, bytes_sent=0, bytes_received=0):
+        self.calls += 1
+        if error:
+            self.errors += 1
+        self.retries += retries
+        self.throttles += throttles
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        self.total_time += seconds
+        self.max_time = max(self.max_time, seconds)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def quantile(self, q):
+        """An upper bound on the q quantile of the latency, from the histogram"""
+        if not self.calls:
+            return None
+        rank = q * self.calls
+        count = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS, self.buckets):
+            count += bucket_count
+            if count >= rank:
+                return min(bound, self.max_time)
+        return self.max_time
+
+    def dump(self):
+        return {
+            'Calls': self.calls,
+            'Errors': self.errors,
+            'Retries': self.retries,
+            'Throttles': self.throttles,
+            'BytesSent': self.bytes_sent,
+            'BytesReceived': self.bytes_received,
+            'TotalSeconds': self.total_time,
+            'MaxSeconds': self.max_time,
+            'LatencyBuckets': [[bound if bound != float('inf') else '+Inf', count]
+                               for bound, count in zip(LATENCY_BUCKETS, self.buckets)],
+        }
+
+class Stats(object):
+    """Thread-safe OperationStats by category ('ssm', 'sts', 'crypto') and operation.
+    :param sizes: Whether to measure the requests and responses given to record() (see size_of()),
+        which serializes each of them; without it only the counts and latencies are recorded.
+    """
+
+    def __init__(self, sizes=True):
+        self._lock = threading.Lock()
+        self.operations = {}
+        self.started_at = time.time()
+        self.sizes = sizes
+
+    def record(self, category, operation, seconds, sent=None, received=None, **kwargs):
+        """Record a call. sent and received are the request and response, recorded as
+        bytes_sent and bytes_received if sizes are measured."""
+        if self.sizes:
+            if sent is not None:
+                kwargs['bytes_sent'] = size_of(sent)
+            if received is not None:
+                kwargs['bytes_received'] = size_of(received)
+        with self._lock:
+            key = (category, operation)
+            if key not in self.operations:
+                self.operations[key] = OperationStats()
+            self.operations[key].record(seconds, **kwargs)
+
+    def items(self):
+        with self._lock:
+            return sorted(six.iteritems(self.operations))
+
+    def dump(self):
+        return {
+            'StartedAt': self.started_at,
+            'Operations': [dict(op.dump(), Category=category, Operation=operation)
+                           for (category, operation), op in self.items()],
+        }
+
+class SummarySink(object):
+    """Print a table of the stats"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def emit(self, stats):
+        rows = [('OPERATION', 'CALLS', 'ERRORS', 'RETRIES', 'THROTTLES', 'TOTAL', 'MEAN', 'P90', 'MAX', 'SENT', 'RECEIVED')]
+        for (category, operation), op in stats.items():
+            rows.append((
+                '{}:{}'.format(category, operation),
+                str(op.calls),
+                str(op.errors),
+                str(op.retries),
+                str(op.throttles),
+                '{:.3f}s'.format(op.total_time),
+                '{:.1f}ms'.format(op.total_time / op.calls * 1000),
+                '{:.1f}ms'.format(op.quantile(0.9) * 1000),
+                '{:.1f}ms'.format(op.max_time * 1000),
+                str(op.bytes_sent),
+                str(op.bytes_received),
+            ))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        for row in rows:
+            self.stream.write('  '.join(value.ljust(width) if i == 0 else value.rjust(width)
+                                        for i, (value, width) in enumerate(zip(row, widths))).rstrip() + '\n')
+
+class JsonSink(object):
+    """Write the stats as JSON to a file name"""
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+
+    def emit(self, stats):
+        with open(self.file_name, 'w') as fp:
+            json.dump(stats.dump(), fp, indent=2, sort_keys=True)
+
+class StatsDSink(object):
+    """Send the stats to StatsD over UDP: counters for calls, errors, retries, throttles,
+    and bytes, and gauges for mean and max latency in milliseconds."""
+
+    def __init__(self, host='localhost', port=8125, prefix='ssm_ctl'):
+        self.address = (host, int(port))
+        self.prefix = prefix
+
+    @classmethod
+    def from_string(cls, value):
+        """Parse HOST[:PORT]"""
+        host, _, port = value.partition(':')
+        return cls(host or 'localhost', int(port) if port else 8125)
+
+    @classmethod
+    def _name(cls, value):
+        return ''.join(c if c.isalnum() or c in '_-' else '_' for c in value)
+
+    def lines(self, stats):
+        for (category, operation), op in stats.items():
+            name = '{}.{}.{}'.format(self.prefix, self._name(category), self._name(operation))
+            for metric, value in [('calls', op.calls), ('errors', op.errors), ('retries', op.retries),
+                                  ('throttles', op.throttles), ('bytes_sent', op.bytes_sent),
+                                  ('bytes_received', op.bytes_received)]:
+                yield '{}.{}:{}|c'.format(name, metric, value)
+            yield '{}.latency_ms.mean:{:.3f}|g'.format(name, op.total_time / op.calls * 1000)
+            yield '{}.latency_ms.max:{:.3f}|g'.format(name, op.max_time * 1000)
+
+    def emit(self, stats):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            for line in self.lines(stats):
+                sock.sendto(line.encode('utf-8'), self.address)
+        finally:
+            sock.close()
+
+class PrometheusTextfileSink(object):
+    """Write the stats in the Prometheus text format, for node_exporter's textfile collector.
+    The file is replaced atomically."""
+
+    def __init__(self, file_name, prefix='ssm_ctl'):
+        self.file_name = file_name
+        self.prefix = prefix
+
+    @classmethod
+    def _labels(cls, category, operation, **extra):
+        labels = [('category', category), ('operation', operation)] + sorted(extra.items())
+        return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels) + '}'
+
+    def lines(self, stats):
+        items = stats.items()
+        counters = [('calls_total', 'calls'), ('errors_total', 'errors'), ('retries_total', 'retries'),
+                    ('throttles_total', 'throttles'), ('sent_bytes_total', 'bytes_sent'),
+                    ('received_bytes_total', 'bytes_received')]
+        for metric, attribute in counters:
+            yield '# TYPE {}_{} counter'.format(self.prefix, metric)
+            for (category, operation), op in items:
+                yield '{}_{}{} {}'.format(self.prefix, metric, self._labels(category, operation), getattr(op, attribute))
+        name = '{}_latency_seconds'.format(self.prefix)
+        yield '# TYPE {} histogram'.format(name)
+        for (category, operation), op in items:
+            count = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS, op.buckets):
+                count += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield '{}_bucket{} {}'.format(name, self._labels(category, operation, le=le), count)
+            yield '{}_sum{} {!r}'.format(name, self._labels(category, operation), op.total_time)
+            yield '{}_count{} {}'.format(name, self._labels(category, operation), op.calls)
+
+    def emit(self, stats):
+        directory = os.path.dirname(os.path.abspath(self.file_name))
+        fd, tmp_name = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fp:
+            for line in self.lines(stats):
+                fp.write(line + '\n')
+        os.rename(tmp_name, self.file_name)
@@ -0,0 +1,120 @@
+"""Timing spans for the phases of a run
+
+Copyright 2018 iRobot Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from __future__ import absolute_import, print_function
+
+import json
+import os
+import threading
+import time
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class Tracer(object):
+    """The tracer interface, which does nothing.
+    span(name, **args) returns a context manager that times the block it wraps;
+    spans nest by being entered within each other on the same thread."""
+
+    def span(self, name, **args):
+        return _NULL_SPAN
+
+class _Span(object):
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = _clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = _clock()
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer._record(self.name, self.start, end, self.args)
+
+class ChromeTracer(Tracer):
+    """Records spans as Chrome trace events, which chrome://tracing, Perfetto,
+    and speedscope can open."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start = _clock()
+        self._threads = {}
+        self.events = []
+
+    def span(self, name, **args):
+        return _Span(self, name, args)
+
+    def _record(self, name, start, end, args):
+        thread = threading.current_thread()
+        event = {
+            'name': name,
+            'ph': 'X',
+            'ts': (start - self._start) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': os.getpid(),
+            'tid': thread.ident,
+        }
+        if args:
+            event['args'] = dict((key, value if isinstance(value, (int, float)) else str(value))
+                                 for key, value in args.items())
+        with self._lock:
+            self._threads[thread.ident] = thread.name
+            self.events.append(event)
+
+    def dump(self):
+        with self._lock:
+            metadata = [{
+                'name': 'thread_name',
+                'ph': 'M',
+                'pid': os.getpid(),
+                'tid': ident,
+                'args': {'name': name},
+            } for ident, name in sorted(self._threads.items())]
+            return {
+                'traceEvents': metadata + sorted(self.events, key=lambda e: e['ts']),
+                'displayTimeUnit': 'ms',
+            }
+
+    def save(self, file_name):
+        with open(file_name, 'w') as fp:
+            json.dump(self.dump(), fp)
+
+_TRACER = Tracer()
+
+def get_tracer():
+    return _TRACER
+
+def set_tracer(tracer):
+    """Set the tracer used by span(); None restores the no-op tracer"""
+    global _TRACER
+    _TRACER = tracer if tracer is not None else Tracer()
+
+def span(name, **args):
+    """A span from the current tracer"""
+    return _TRACER.span(name, **args)
@@ -17,6 +17,8 @@ limitations under the License.
 
 import six
 import re
+import sys
+import threading
 
 class VarString(object):
     _VAR_NAME_PATTERN_STR = r'\w+'
@@ -49,6 +51,11 @@ class VarString(object):
         for name in sorted(cls.NAMES):
             cls._VAR_VALUES[name] = resolver(name)
     
+    @classmethod
+    def get_var_value(cls, name):
+        """The resolved value (e.g., an Input) for the variable name"""
+        return cls._VAR_VALUES[name]
+    
     @classmethod
     def load(cls, obj, encrypted=None):
         if not isinstance(obj, six.string_types):
@@ -99,6 +106,15 @@ class VarString(object):
         
         self._value = None if self.names else self.string
     
+    def __setstate__(self, state):
+        # Unpickled VarStrings (see filecache) have to register their names like new ones
+        self.__dict__.update(state)
+        self.NAMES.update(self.names)
+    
+    @property
+    def encrypted(self):
+        return self._encrypted
+    
     def get_value(self, decrypt=True):
         if not self._value:
             value = self.string
@@ -132,4 +148,91 @@ class VarString(object):
 def batch(iterable, n):
     l = len(iterable)
     for ndx in range(0, l, n):
-        yield iterable[ndx:min(ndx + n, l)]
\ No newline at end of file
+        yield iterable[ndx:min(ndx + n, l)]
+
+def is_subpath(path, prefix):
+    """Check if path is the same as, or under, the prefix path (not just a string prefix)"""
+    prefix = prefix.rstrip('/')
+    return path == prefix or path.startswith(prefix + '/')
+
+def covering_paths(paths):
+    """Reduce the paths to a minimal set of paths that every given path is under."""
+    covers = []
+    for path in sorted(set(paths), key=len):
+        if not any(is_subpath(path, cover) for cover in covers):
+            covers.append(path)
+    return covers
+
+def assign_listings(paths, listings):
+    """Get the listing of each of the paths from listings, a dict of recursive listings
+    (lists of ParameterMetadata) of the paths or of paths covering them (see covering_paths()).
+    Returns a dict of path to the list of ParameterMetadata on that path."""
+    path_listings = {}
+    for path in paths:
+        if path in listings:
+            path_listings[path] = listings[path]
+            continue
+        cover = next(c for c in listings if is_subpath(path, c))
+        path_listings[path] = [m for m in listings[cover] if is_subpath(m.name, path)]
+    return path_listings
+
+def concurrent_map(func, iterable, concurrency):
+    """Map func over iterable using a pool of threads, returning results in order.
+    With a concurrency of 1 or less, or fewer than 2 items, runs in the calling thread."""
+    items = list(iterable)
+    if not concurrency or concurrency <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(processes=min(concurrency, len(items)))
+    try:
+        return pool.map(func, items, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+def prefetch(iterable, depth):
+    """Iterate over iterable in a background thread, keeping up to depth items
+    ready in a bounded queue ahead of the consumer, so that producing items (e.g.,
+    fetching pages) overlaps with consuming them. Exceptions from the iterable are
+    raised in the consumer. With a depth of 0 or less, iterates in the calling thread."""
+    if not depth or depth < 1:
+        for item in iterable:
+            yield item
+        return
+    
+    done = object()
+    items = six.moves.queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except six.moves.queue.Full:
+                pass
+        return False
+    
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException:
+            put((done, sys.exc_info()))
+        else:
+            put((done, None))
+    
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item, exc_info = items.get()
+            if item is done:
+                if exc_info:
+                    six.reraise(*exc_info)
+                return
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,150 @@
+from __future__ import absolute_import, print_function
+
+from .config import unittest
+
+import sys
+
+if sys.version_info >= (3, 5):
+    import asyncio
+    from ssm_ctl.aio import AsyncSSMClient, ExecutorClient
+
+class ThrottlingError(Exception):
+    def __init__(self):
+        super(ThrottlingError, self).__init__('Rate exceeded')
+        self.response = {'Error': {'Code': 'ThrottlingException'}}
+
+class FakeSSM(object):
+    """Just enough of the SSM API, with pages of 2, optionally throttling the first call"""
+    def __init__(self, names=(), throttle_first=False):
+        self.parameters = dict((name, {'Name': name, 'Type': 'String', 'Value': 'v', 'Version': 1}) for name in names)
+        self.calls = []
+        self.throttled = not throttle_first
+
+    def _record(self, operation):
+        self.calls.append(operation)
+        if not self.throttled:
+            self.throttled = True
+            raise ThrottlingError()
+
+    def _page(self, items, kwargs):
+        start = int(kwargs.get('NextToken', 0))
+        response = {'Parameters': items[start:start + 2]}
+        if start + 2 < len(items):
+            response['NextToken'] = str(start + 2)
+        return response
+
+    def _under(self, path):
+        return sorted((p for n, p in self.parameters.items() if n.startswith(path.rstrip('/') + '/')), key=lambda p: p['Name'])
+
+    def get_parameters_by_path(self, **kwargs):
+        self._record('get_parameters_by_path')
+        return self._page([dict(p) for p in self._under(kwargs['Path'])], kwargs)
+
+    def describe_parameters(self, **kwargs):
+        self._record('describe_parameters')
+        f = kwargs['ParameterFilters'][0]
+        if f['Key'] == 'Path':
+            items = self._under(f['Values'][0])
+        else:
+            items = [self.parameters[n] for n in f['Values'] if n in self.parameters]
+        return self._page([{'Name': p['Name'], 'Type': p['Type'], 'Version': p['Version']} for p in items], kwargs)
+
+    def get_parameters(self, **kwargs):
+        self._record('get_parameters')
+        return {
+            'Parameters': [dict(self.parameters[n]) for n in kwargs['Names'] if n in self.parameters],
+            'InvalidParameters': [n for n in kwargs['Names'] if n not in self.parameters],
+        }
+
+    def put_parameter(self, **kwargs):
+        self._record('put_parameter')
+        self.parameters[kwargs['Name']] = {'Name': kwargs['Name'], 'Type': kwargs['Type'], 'Value': kwargs['Value'], 'Version': 1}
+        return {'Version': 1}
+
+    def delete_parameters(self, **kwargs):
+        self._record('delete_parameters')
+        for name in kwargs['Names']:
+            self.parameters.pop(name, None)
+        return {'DeletedParameters': kwargs['Names'], 'InvalidParameters': []}
+
+@unittest.skipIf(sys.version_info < (3, 5), 'asyncio interface requires Python 3.5')
+class TestAsyncSSMClient(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.fake = FakeSSM(['/App/{}'.format(i) for i in range(5)] + ['/Other/A'])
+        self.client = AsyncSSMClient(ExecutorClient(self.fake), concurrency=4)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_coroutine(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_get_path(self):
+        self.fake.throttled = False
+        parameters = self.run_coroutine(self.client.get_path('/App', reencrypt=False))
+        self.assertEqual([p['Name'] for p in parameters], ['/App/{}'.format(i) for i in range(5)])
+        self.assertEqual(self.client.rate_limiter().throttles, 1)
+
+    def test_get_path_full(self):
+        parameters = self.run_coroutine(self.client.get_path('/App', full=True, reencrypt=False))
+        self.assertEqual([p['Name'] for p in parameters], ['/App/{}'.format(i) for i in range(5)])
+        # The listing is described once, in pages of 2, and not again for each batch
+        self.assertEqual(self.fake.calls.count('describe_parameters'), 3)
+
+    def test_transient_errors_are_retried(self):
+        get_parameters = self.fake.get_parameters
+        def flaky_get_parameters(**kwargs):
+            if not self.fake.calls.count('get_parameters'):
+                self.fake.calls.append('get_parameters')
+                error = Exception('Internal error')
+                error.response = {'Error': {'Code': 'InternalServerError'}}
+                raise error
+            return get_parameters(**kwargs)
+        self.fake.get_parameters = flaky_get_parameters
+        parameters = self.run_coroutine(self.client.get(['/App/0'], reencrypt=False))
+        self.assertEqual([p['Name'] for p in parameters], ['/App/0'])
+        self.assertEqual(self.client.rate_limiter().throttles, 0)
+
+    def test_get_invalid(self):
+        with self.assertRaises(KeyError):
+            self.run_coroutine(self.client.get(['/App/0', '/App/Missing'], reencrypt=False))
+
+    def test_put_diff_delete(self):
+        results = self.run_coroutine(self.client.batch_put(
+            [{'Name': '/App/New', 'Type': 'String', 'Value': 'x'}]))
+        self.assertEqual([(r.name, r.error) for r in results], [('/App/New', None)])
+
+        diff = self.run_coroutine(self.client.diff_paths(['/App', '/App/0'], ['/App/0', '/App/1', '/Elsewhere/X']))
+        self.assertEqual(diff.add, ['/Elsewhere/X'])
+        self.assertEqual(diff.overwrite, ['/App/0', '/App/1'])
+        self.assertEqual(diff.remove, ['/App/2', '/App/3', '/App/4', '/App/New'])
+
+        self.run_coroutine(self.client.delete(diff.remove))
+        self.assertEqual(sorted(self.fake.parameters), ['/App/0', '/App/1', '/Other/A'])
+
+    def test_class_factories(self):
+        sessions = []
+        class Client(AsyncSSMClient):
+            pass
+        Client.SESSION_FACTORY = lambda: sessions.append(object()) or sessions[-1]
+        Client.CLIENT_FACTORY = lambda session, name: ExecutorClient(self.fake)
+        client = Client(concurrency=4)
+        names = self.run_coroutine(client.get_path('/App', names_only=True))
+        self.assertEqual(names, ['/App/{}'.format(i) for i in range(5)])
+        self.assertEqual(len(sessions), 1)
+
+        async def client_factory(session, name):
+            return ExecutorClient(self.fake)
+        client = Client(concurrency=4)
+        client.CLIENT_FACTORY = client_factory
+        self.assertEqual(len(self.run_coroutine(client.get_path('/App', names_only=True))), 5)
+
+    def test_sync_client(self):
+        # No session is needed (or created) for the SSM calls
+        client = self.client.sync_client()
+        names = client.get_path('/App', names_only=True)
+        self.assertEqual(names, ['/App/{}'.format(i) for i in range(5)])
+
+if __name__ == '__main__':
+    unittest.main()
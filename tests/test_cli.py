@@ -0,0 +1,84 @@
+from __future__ import absolute_import, print_function
+
+from .config import unittest
+
+from ssm_ctl import cli
+from ssm_ctl.ssm import SSMClient, clientmethod
+from ssm_ctl.parameters import SSMParameter
+from ssm_ctl.fake import FakeBackend
+
+from .test_snapshot import SnapshotCLITestCase
+from .test_ssm import SSMClientTestCase
+
+class TestDownloadCLI(SnapshotCLITestCase):
+    def setUp(self):
+        super(TestDownloadCLI, self).setUp()
+        for name in ['/App/a1', '/App/a2/x', '/App/B', '/App/_c', '/App/9/d', '/Other/a']:
+            self.backend.ssm.put_parameter(Name=name, Value=name, Type='String', Description='d')
+    
+    def test_sharded_output_matches(self):
+        expected = self.run_main(['download', '/App'])
+        self.assertIn('/App/9/d', expected)
+        for shards in ['1', '4']:
+            self.assertEqual(self.run_main(['download', '--shards', shards, '/App']), expected)
+    
+    def test_shards_must_be_positive(self):
+        for shards in ['0', '-1']:
+            with self.assertRaises(SystemExit):
+                self.run_main(['download', '--shards', shards, '/App'])
+        self.assertEqual(cli.positive_int('3'), 3)
+
+class TestChangedParameters(SSMClientTestCase):
+    def setUp(self):
+        super(TestChangedParameters, self).setUp()
+        self.put('/App/Unchanged', 'value', Description='d')
+        self.put('/App/Value', 'old', Description='d')
+        self.put('/App/Description', 'value', Description='old')
+        self.put('/App/List', 'a,b', type='StringList')
+    
+    def test_differs_from(self):
+        current = self.client.get_current(['/App/Unchanged', '/App/List'])
+        self.assertFalse(SSMParameter('/App/Unchanged', 'String', 'value', description='d').differs_from(current['/App/Unchanged']))
+        self.assertTrue(SSMParameter('/App/Unchanged', 'String', 'value').differs_from(current['/App/Unchanged']))
+        self.assertTrue(SSMParameter('/App/Unchanged', 'StringList', 'value', description='d').differs_from(current['/App/Unchanged']))
+        self.assertFalse(SSMParameter('/App/List', 'StringList', ['a', 'b']).differs_from(current['/App/List']))
+        self.assertTrue(SSMParameter('/App/List', 'StringList', ['b', 'a']).differs_from(current['/App/List']))
+        self.assertTrue(SSMParameter('/App/Missing', 'String', 'value').differs_from(None))
+    
+    def test_changed_parameters(self):
+        parameters = [
+            SSMParameter('/App/Unchanged', 'String', 'value', description='d'),
+            SSMParameter('/App/Value', 'String', 'new', description='d'),
+            SSMParameter('/App/Description', 'String', 'value', description='new'),
+            SSMParameter('/App/List', 'StringList', ['a', 'b']),
+            SSMParameter('/App/Missing', 'String', 'value'),
+        ]
+        changed = cli.changed_parameters(parameters, client=self.client)
+        self.assertEqual([p.get_name() for p in changed], ['/App/Value', '/App/Description', '/App/Missing'])
+
+class TestDeployRegions(SnapshotCLITestCase):
+    def setUp(self):
+        super(TestDeployRegions, self).setUp()
+        self.backends = {
+            'us-east-1': self.backend,
+            'eu-west-1': FakeBackend(region_name='eu-west-1'),
+        }
+        SSMClient.SESSION_FACTORY = clientmethod(lambda client: self.backends[client.region_name or 'us-east-1'].session)
+    
+    def test_deploy_to_regions(self):
+        file_name = self.write_file('.BASEPATH: /App\na: value-a\nb: value-b\n')
+        output = self.run_main(['deploy', '--regions', 'us-east-1, eu-west-1', file_name])
+        for region, backend in self.backends.items():
+            self.assertEqual(sorted(backend.ssm.parameters), ['/App/a', '/App/b'])
+            self.assertEqual(backend.ssm.get_parameters(Names=['/App/a'])['Parameters'][0]['Value'], 'value-a')
+            self.assertIn('[{}] '.format(region), output)
+    
+    def test_region_input_is_rejected(self):
+        file_name = self.write_file('.BASEPATH: /App\na: $(Region)\n')
+        with self.assertRaises(SystemExit):
+            self.run_main(['deploy', '--regions', 'us-east-1,eu-west-1', file_name])
+        for backend in self.backends.values():
+            self.assertEqual(backend.ssm.parameters, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,8 +5,19 @@ from . import config
 
 from . import util
 
+import collections
+import os
+import shutil
+import tempfile
+
+import yaml
+
 import ssm_ctl
-from ssm_ctl.files import load_parameters
+from ssm_ctl.files import load_parameters, load_parameter_files, decrypt_values, Input
+from ssm_ctl.ssm import SSMClient
+from ssm_ctl.fake import FakeBackend
+from ssm_ctl.filecache import ParameterFileCache
+from ssm_ctl.util import VarString
 
 """
 .INPUTS:
@@ -127,5 +138,139 @@ class TestLoading(unittest.TestCase):
         stringlist_param = parameters['/Test/StringListParam/Inline']
         self.assertEqual(stringlist_param.type, 'StringList')
 
+class TestParallelParsing(unittest.TestCase):
+    def tearDown(self):
+        VarString.NAMES.clear()
+        VarString._VAR_VALUES.clear()
+    
+    def test_same_as_serial(self):
+        files = collections.OrderedDict(('ssm{}.yaml'.format(i), util.load("""
+        .INPUTS:
+            Env:
+                Description: From file {0}
+        .BASEPATH: /Test/$(Env)
+        Shared: value{0}
+        Param{0}: [a, b]
+        """.format(i))) for i in range(4))
+        
+        serial = load_parameter_files(files, processes=1)
+        VarString.NAMES.clear()
+        parallel = load_parameter_files(files, processes=2)
+        self.assertEqual(VarString.NAMES, set(['Env']))
+        
+        self.assertEqual(sorted(parallel.parameters), sorted(serial.parameters))
+        # Merged in file order, so the last file wins and the first file's input description is kept
+        self.assertEqual(parallel.parameters['Shared'].get_value(), 'value3')
+        self.assertEqual(parallel.inputs['Env'].description, serial.inputs['Env'].description)
+        self.assertEqual(parallel.inputs['Env'].description, 'From file 0')
+        self.assertEqual(len(parallel.base_paths), 4)
+    
+    def test_error(self):
+        files = {'good.yaml': 'Param: value', 'bad.yaml': 'Param: [value'}
+        with self.assertRaises(yaml.YAMLError):
+            load_parameter_files(files, processes=2)
+
+class TestFileCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ParameterFileCache(self.directory)
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        VarString.NAMES.clear()
+        VarString._VAR_VALUES.clear()
+    
+    def test_cached_load(self):
+        obj = util.load("""
+        .INPUTS:
+            Env: String
+        .BASEPATH: /Test/$(Env)
+        StringParam: $(Env)-value
+        StringListParam: [a, b]
+        """)
+        
+        data = load_parameter_files({'ssm.yaml': obj}, cache=self.cache)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+        
+        VarString.NAMES.clear()
+        data = load_parameter_files({'ssm.yaml': obj}, cache=self.cache)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        # Unpickled VarStrings register their names for resolution
+        self.assertEqual(VarString.NAMES, set(['Env']))
+        
+        data.inputs['Env'].set_value('prod')
+        VarString.resolve(Input.get_resolver(data.inputs, prompt=False))
+        self.assertEqual(VarString.dump(data.base_paths[0]), '/Test/prod')
+        self.assertEqual(data.parameters['StringParam'].get_value(), 'prod-value')
+        self.assertEqual(data.parameters['StringListParam'].get_value(), 'a,b')
+        
+        load_parameter_files({'ssm.yaml': obj}, var_mode='reduced', cache=self.cache)
+        self.assertEqual(self.cache.misses, 2)
+    
+    def test_prune(self):
+        for i in range(3):
+            load_parameter_files({'ssm.yaml': '/Test/Param{}: value'.format(i)}, cache=self.cache)
+        self.cache.max_bytes = max(os.path.getsize(os.path.join(self.directory, f))
+                                   for f in os.listdir(self.directory))
+        self.cache.prune()
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+    
+    @unittest.skipUnless(hasattr(os, 'getuid'), 'POSIX ownership')
+    def test_shared_files_are_not_loaded(self):
+        text = '/Test/Param: value'
+        load_parameter_files({'ssm.yaml': text}, cache=self.cache)
+        file_name, = [os.path.join(self.directory, f) for f in os.listdir(self.directory)]
+        
+        os.chmod(file_name, 0o644)
+        load_parameter_files({'ssm.yaml': text}, cache=self.cache)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+        
+        os.chmod(file_name, 0o600)
+        os.chmod(self.directory, 0o777)
+        load_parameter_files({'ssm.yaml': text}, cache=self.cache)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 3))
+        
+        os.chmod(self.directory, 0o700)
+        load_parameter_files({'ssm.yaml': text}, cache=self.cache)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 3))
+
+class TestDecryptValues(unittest.TestCase):
+    def setUp(self):
+        self.backend = FakeBackend()
+        self.uninstall = self.backend.install(SSMClient)
+    
+    def tearDown(self):
+        self.uninstall()
+        VarString.NAMES.clear()
+        VarString._VAR_VALUES.clear()
+    
+    def test_decrypt_values(self):
+        kms = self.backend.kms
+        obj = {
+            '.INPUTS': {'Secret': 'SecureString'},
+            '/App/Stored': {'EncryptedValue': kms.encrypt('stored', 'key'), 'KeyId': 'key'},
+            '/App/Input1': {'Type': 'SecureString', 'Input': 'Secret', 'KeyId': 'key'},
+            '/App/Input2': {'Type': 'SecureString', 'Input': 'Secret', 'KeyId': 'key'},
+            '/App/Disabled': {'EncryptedValue': kms.encrypt('disabled', 'key'), 'KeyId': 'key', 'Disable': True},
+            '/App/Plain': 'plain',
+        }
+        data = load_parameter_files({'ssm.yaml': yaml.dump(obj)})
+        data.inputs['Secret'].set_value(kms.encrypt('secret', 'key'))
+        VarString.resolve(Input.get_resolver(data.inputs, prompt=False))
+        kms.calls.clear()
+        
+        decrypt_values(data.parameters.values(), concurrency=4)
+        # The input is decrypted once for both parameters, and the disabled one not at all
+        self.assertEqual(kms.calls['Decrypt'], 2)
+        
+        values = dict((name, p.get_value()) for name, p in data.parameters.items() if not p.disable)
+        self.assertEqual(values, {
+            '/App/Stored': 'stored',
+            '/App/Input1': 'secret',
+            '/App/Input2': 'secret',
+            '/App/Plain': 'plain',
+        })
+        self.assertEqual(kms.calls['Decrypt'], 2)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,52 @@
+from __future__ import absolute_import, print_function
+
+from .config import unittest
+
+from ssm_ctl.pathindex import PathIndex, PathDiff, LOCAL, REMOTE
+
+class TestPathIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = PathIndex(
+            local=['/App/a', '/App/Prod/b', '/Application/c', '/Other/d'],
+            remote=['/App/a', '/App/Prod/old', '/Application/c'])
+
+    def test_names(self):
+        self.assertEqual(self.index.names('/App'), ['/App/Prod/b', '/App/a'])
+        self.assertEqual(self.index.names('/App', REMOTE), ['/App/Prod/old', '/App/a'])
+        self.assertEqual(self.index.names('/Missing'), [])
+
+    def test_count(self):
+        self.assertEqual(self.index.count(), 4)
+        self.assertEqual(self.index.count('/App', LOCAL), 2)
+        self.assertEqual(self.index.count('/App/Prod', REMOTE), 1)
+
+    def test_diff(self):
+        diff = self.index.diff('/App')
+        self.assertEqual(diff.add, ['/App/Prod/b'])
+        self.assertEqual(diff.overwrite, ['/App/a'])
+        self.assertEqual(diff.remove, ['/App/Prod/old'])
+
+        diff = self.index.diff()
+        self.assertEqual(diff.add, ['/App/Prod/b', '/Other/d'])
+        self.assertEqual(diff.overwrite, ['/App/a', '/Application/c'])
+
+    def test_discard(self):
+        self.index.discard('/App/Prod/old', REMOTE)
+        self.assertEqual(self.index.count('/App', REMOTE), 1)
+        self.assertEqual(self.index.diff('/App/Prod').remove, [])
+        self.assertIn('/App/Prod/b', self.index)
+        self.assertNotIn('/App/Prod/old', self.index)
+
+    def test_non_hierarchical_names(self):
+        index = PathIndex(local=['foo'], remote=['/foo'])
+        self.assertEqual(index.diff(), PathDiff(['foo'], [], ['/foo']))
+        self.assertEqual(index.names('/'), [])
+        self.assertEqual(index.names('/', side=REMOTE), ['/foo'])
+        self.assertEqual(index.count('foo'), 1)
+        self.assertEqual(index.count('/foo'), 0)
+        index.discard('/foo', side=REMOTE)
+        self.assertIn('foo', index)
+        self.assertNotIn('/foo', index)
+
+if __name__ == '__main__':
+    unittest.main()
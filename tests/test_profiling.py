@@ -0,0 +1,51 @@
+from __future__ import absolute_import, print_function
+
+from .config import unittest
+
+import os
+import pstats
+import shutil
+import tempfile
+import time
+
+from six import StringIO
+
+from ssm_ctl import profiling, util
+from ssm_ctl.cli import _split_profile_arg
+
+def work():
+    return util.concurrent_map(lambda i: time.sleep(0.02) or i, range(4), 4)
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_deterministic(self):
+        file_name = os.path.join(self.directory, 'profile.pstats')
+        output = StringIO()
+        self.assertEqual(profiling.run_profiled(work, file_name, stream=output), [0, 1, 2, 3])
+        stats = pstats.Stats(file_name)
+        functions = [function for _, _, function in stats.stats]
+        # The worker threads are profiled too
+        self.assertIn('<lambda>', functions)
+        self.assertIn('function calls', output.getvalue())
+
+    def test_sampling(self):
+        file_name = os.path.join(self.directory, 'profile.collapsed')
+        output = StringIO()
+        profiling.run_profiled(work, file_name, mode=profiling.SAMPLING, stream=output)
+        with open(file_name) as fp:
+            lines = fp.read().splitlines()
+        self.assertTrue(lines)
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in lines))
+        self.assertIn('samples every', output.getvalue())
+
+    def test_split_profile_arg(self):
+        self.assertEqual(_split_profile_arg(['--profile', '/Path', '--profile=out', '--', '--profile']),
+                         ['--profile=', '/Path', '--profile=out', '--', '--profile'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+from __future__ import absolute_import, print_function
+
+from .config import unittest
+
+import time
+
+from ssm_ctl.rate import TokenBucket, AdaptiveRateLimiter
+
+class TestTokenBucket(unittest.TestCase):
+    def test_unlimited(self):
+        bucket = TokenBucket()
+        start = time.time()
+        for _ in range(1000):
+            bucket.acquire()
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_burst_then_limit(self):
+        bucket = TokenBucket(rate=20, capacity=5)
+        start = time.time()
+        for _ in range(5):
+            bucket.acquire()
+        self.assertLess(time.time() - start, 0.1)
+
+        for _ in range(4):
+            bucket.acquire()
+        self.assertGreaterEqual(time.time() - start, 0.15)
+
+class TestAdaptiveRateLimiter(unittest.TestCase):
+    def test_decrease_on_throttle(self):
+        limiter = AdaptiveRateLimiter(initial_rate=100, cooldown=0)
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 50)
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 25)
+        self.assertEqual(limiter.throttles, 2)
+
+    def test_throttle_cooldown(self):
+        limiter = AdaptiveRateLimiter(initial_rate=100, cooldown=60)
+        limiter.on_throttle()
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 50)
+
+    def test_first_throttle_uses_observed_rate(self):
+        limiter = AdaptiveRateLimiter(min_rate=1)
+        self.assertIsNone(limiter.rate)
+        for _ in range(10):
+            limiter.acquire()
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 5)
+
+    def test_increase_on_success(self):
+        limiter = AdaptiveRateLimiter(initial_rate=10, max_rate=10.5)
+        limiter.on_success()
+        self.assertAlmostEqual(limiter.rate, 10.1)
+        for _ in range(10):
+            limiter.on_success()
+        self.assertEqual(limiter.rate, 10.5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+from __future__ import absolute_import, print_function
+
+from .config import unittest
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from six import StringIO
+
+from ssm_ctl import cli
+from ssm_ctl.ssm import SSMClient, ParameterMetadata
+from ssm_ctl.snapshot import Snapshot, SnapshotCache
+from ssm_ctl.parameters import SSMParameter
+from ssm_ctl.fake import FakeBackend
+from ssm_ctl.util import VarString
+
+class TestSnapshot(unittest.TestCase):
+    def test_update(self):
+        snapshot = Snapshot('123456789012', 'us-east-1', '/App')
+        self.assertEqual(snapshot.update([ParameterMetadata('/App/A', 'String', 1, None),
+                                          ParameterMetadata('/App/B', 'String', 1, None)]),
+                         ['/App/A', '/App/B'])
+        snapshot.set_hash('/App/A', 1, 'hash-a')
+        snapshot.set_hash('/App/B', 1, 'hash-b')
+        
+        changed = snapshot.update([ParameterMetadata('/App/A', 'String', 1, None),
+                                   ParameterMetadata('/App/B', 'String', 2, None),
+                                   ParameterMetadata('/App/C', 'String', 1, None)])
+        self.assertEqual(changed, ['/App/B', '/App/C'])
+        # Hashes are kept only for unchanged versions, and removed parameters are dropped
+        self.assertEqual(snapshot.entries['/App/A'].value_hash, 'hash-a')
+        self.assertIsNone(snapshot.entries['/App/B'].value_hash)
+        snapshot.update([ParameterMetadata('/App/C', 'String', 1, None)])
+        self.assertEqual(sorted(snapshot.entries), ['/App/C'])
+
+class TestSnapshotCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = SnapshotCache(self.directory)
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def snapshot(self, path='/App'):
+        snapshot = Snapshot('123456789012', 'us-east-1', path)
+        snapshot.update([ParameterMetadata(path + '/A', 'String', 3, None)])
+        snapshot.set_hash(path + '/A', 3, 'hash')
+        return snapshot
+    
+    def test_load_and_save(self):
+        self.cache.save(self.snapshot())
+        loaded = self.cache.load('123456789012', 'us-east-1', '/App')
+        self.assertEqual(loaded.entries['/App/A'].version, 3)
+        self.assertEqual(loaded.entries['/App/A'].value_hash, 'hash')
+        
+        self.assertEqual(self.cache.load('123456789012', 'us-west-2', '/App').entries, {})
+        
+        self.cache.max_age = 0
+        time.sleep(0.01)
+        self.assertEqual(self.cache.load('123456789012', 'us-east-1', '/App').entries, {})
+    
+    def test_salt(self):
+        salt = self.cache.salt
+        self.assertEqual(SnapshotCache(self.directory).salt, salt)
+        self.assertNotEqual(SnapshotCache(tempfile.mkdtemp(dir=self.directory)).salt, salt)
+    
+    def test_prune(self):
+        for i in range(3):
+            self.cache.save(self.snapshot('/App{}'.format(i)))
+        file_names = [f for f in os.listdir(self.directory) if f.endswith('.json')]
+        self.cache.max_bytes = os.path.getsize(os.path.join(self.directory, file_names[0]))
+        self.cache.prune()
+        self.assertEqual(len([f for f in os.listdir(self.directory) if f.endswith('.json')]), 1)
+        
+        self.cache.max_age = -1
+        self.cache.prune()
+        self.assertEqual([f for f in os.listdir(self.directory) if f.endswith('.json')], [])
+
+class SnapshotCLITestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self._environ = os.environ.get('SSMCTL_CACHE_DIR')
+        os.environ['SSMCTL_CACHE_DIR'] = self.directory
+        self.backend = FakeBackend()
+        self.uninstall = self.backend.install(SSMClient)
+    
+    def tearDown(self):
+        self.uninstall()
+        SSMClient.SNAPSHOT_CACHE = None
+        SSMParameter.OVERWRITE_DEFAULT = False
+        VarString.NAMES.clear()
+        VarString._VAR_VALUES.clear()
+        if self._environ is None:
+            del os.environ['SSMCTL_CACHE_DIR']
+        else:
+            os.environ['SSMCTL_CACHE_DIR'] = self._environ
+        shutil.rmtree(self.directory)
+    
+    def write_file(self, text):
+        file_name = os.path.join(self.directory, 'ssm.yaml')
+        with open(file_name, 'w') as fp:
+            fp.write(text)
+        return file_name
+    
+    def run_main(self, args):
+        """Run the command with a fresh default client, returning stdout"""
+        SSMClient.set_default(None)
+        SSMClient.SNAPSHOT_CACHE = None
+        VarString.NAMES.clear()
+        VarString._VAR_VALUES.clear()
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = StringIO(), StringIO()
+        try:
+            cli.main(args)
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+class TestSnapshotCLI(SnapshotCLITestCase):
+    def test_puts_are_recorded(self):
+        file_name = self.write_file('.BASEPATH: /App\na: value-a\nb: value-b\n')
+        snapshot_args = ['--snapshot-cache', '--snapshot-max-age', '600']
+        self.run_main(['deploy', '--diff', file_name] + snapshot_args)
+        
+        output = self.run_main(['diff', file_name] + snapshot_args)
+        added = output.split('*** PARAMETERS TO ADD ***')[1].split('***')[0]
+        self.assertEqual(added.split(), [])
+        self.assertIn('/App/a', output.split('*** PARAMETERS TO OVERWRITE ***')[1])
+    
+    def test_unchanged_hashes_skip_fetching(self):
+        file_name = self.write_file('.BASEPATH: /App\na: value-a\nb: value-b\n')
+        snapshot_args = ['--snapshot-cache', '--snapshot-max-age', '600']
+        self.run_main(['deploy', file_name] + snapshot_args)
+        
+        self.backend.ssm.calls.clear()
+        output = self.run_main(['deploy', '--changed-only', file_name] + snapshot_args)
+        self.assertIn('Skipping 2 unchanged parameters', output)
+        self.assertEqual(sum(self.backend.ssm.calls.values()), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,345 @@
+from __future__ import absolute_import, print_function
+
+from .config import unittest
+
+import sys
+import threading
+import time
+import types
+
+from ssm_ctl.ssm import SSMClient, DecryptCache
+from ssm_ctl.rate import AdaptiveRateLimiter
+from ssm_ctl.fake import FakeBackend
+
+class SSMClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.backend = FakeBackend()
+        self.client = SSMClient()
+        self.backend.install(self.client)
+
+    def put(self, name, value='value', type='String', **kwargs):
+        self.backend.ssm.put_parameter(Name=name, Value=value, Type=type, **kwargs)
+
+class TestFakeBackend(SSMClientTestCase):
+    def test_pagination(self):
+        for i in range(25):
+            self.put('/App/{:02d}'.format(i))
+        paginator = self.backend.ssm.get_paginator('get_parameters_by_path')
+        pages = list(paginator.paginate(Path='/App', Recursive=True))
+        self.assertEqual([len(page['Parameters']) for page in pages], [10, 10, 5])
+
+    def test_throttle(self):
+        backend = FakeBackend(tps=1)
+        backend.ssm.get_parameters(Names=['/A'])
+        with self.assertRaises(Exception) as context:
+            backend.ssm.get_parameters(Names=['/A'])
+        self.assertTrue(self.client._is_throttle(context.exception))
+        self.assertEqual(backend.ssm.throttles['GetParameters'], 1)
+
+    def test_kms(self):
+        ciphertext = self.backend.kms.encrypt('secret', 'key')
+        self.assertNotIn('secret', ciphertext)
+        self.assertEqual(self.backend.kms.decrypt(ciphertext), 'secret')
+
+class TestSSMClient(SSMClientTestCase):
+    def test_region_and_account(self):
+        self.assertEqual(self.client.get_region(), 'us-east-1')
+        self.assertEqual(self.client.format_key_id('alias/key'), 'arn:aws:kms:us-east-1:123456789012:alias/key')
+
+    def test_get_path(self):
+        for i in range(25):
+            self.put('/App/{:02d}'.format(i), Description='d')
+        self.put('/Other')
+
+        parameters = self.client.get_path('/App')
+        self.assertEqual([p['Name'] for p in parameters], ['/App/{:02d}'.format(i) for i in range(25)])
+
+        parameters = self.client.get_path('/App', full=True, page_size=7)
+        self.assertEqual(len(parameters), 25)
+        self.assertEqual(parameters[0]['Description'], 'd')
+
+        self.assertEqual(self.client.get_path('/App', names_only=True), [p['Name'] for p in parameters])
+
+    def test_get_path_full_describes_once(self):
+        for i in range(25):
+            self.put('/App/{:02d}'.format(i), Description='d')
+        self.backend.ssm.calls.clear()
+        parameters = self.client.get_path('/App', full=True, page_size=7)
+        self.assertEqual([p['Name'] for p in parameters], ['/App/{:02d}'.format(i) for i in range(25)])
+        self.assertEqual(self.backend.ssm.calls['DescribeParameters'], 4)
+        self.assertEqual(self.backend.ssm.calls['GetParameters'], 4)
+
+    def test_get_path_full_fetches_batches_concurrently(self):
+        for i in range(50):
+            self.put('/App/{:02d}'.format(i))
+        self.backend.ssm.latency = 0.02
+        get_parameters = self.backend.ssm.get_parameters
+        lock = threading.Lock()
+        in_flight = [0, 0]
+        def tracked_get_parameters(**kwargs):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            try:
+                return get_parameters(**kwargs)
+            finally:
+                with lock:
+                    in_flight[0] -= 1
+        self.backend.ssm.get_parameters = tracked_get_parameters
+        parameters = self.client.get_path('/App', full=True)
+        self.assertEqual([p['Name'] for p in parameters], ['/App/{:02d}'.format(i) for i in range(50)])
+        self.assertGreater(in_flight[1], 1)
+
+    def test_get_path_sharded(self):
+        for name in ['/App/a1', '/App/a2/x', '/App/B', '/App/_c', '/App/9/d', '/Other/a']:
+            self.put(name, name, Description='d')
+        self.put('/App/Secret', 'secret', type='SecureString', KeyId='key')
+        expected = self.client.get_path('/App', full=True, reencrypt=False)
+        for shards in [1, 3, 100]:
+            self.assertEqual(self.client.get_path_sharded('/App', shards=shards, reencrypt=False), expected)
+        with self.assertRaises(ValueError):
+            self.client.get_path_sharded('/App', shards=-1)
+
+    def test_reencrypt(self):
+        self.put('/App/Secret', 'secret', type='SecureString', KeyId='key')
+        parameter, = self.client.get(['/App/Secret'], full=True)
+        self.assertEqual(self.backend.kms.decrypt(parameter['EncryptedValue']), 'secret')
+
+    def test_concurrent_reencryption_order(self):
+        import random
+        names = ['/App/{:02d}'.format(i) for i in range(30)]
+        for name in names:
+            self.put(name, 'secret-' + name, type='SecureString', KeyId='key')
+        # Encryptions finish out of order
+        self.backend.kms.latency = lambda: random.uniform(0, 0.01)
+        self.client.REENCRYPT_CONCURRENCY = 8
+        for parameters in [self.client.get_path('/App', full=True), self.client.get(names, full=True)]:
+            self.assertEqual([p['Name'] for p in parameters], names)
+            for parameter in parameters:
+                self.assertNotIn('Value', parameter)
+                self.assertEqual(self.backend.kms.decrypt(parameter['EncryptedValue']), 'secret-' + parameter['Name'])
+
+    def test_batch_put(self):
+        self.put('/App/Existing')
+        results = self.client.batch_put([
+            {'Name': '/App/New', 'Type': 'String', 'Value': 'new'},
+            {'Name': '/App/Existing', 'Type': 'String', 'Value': 'new'},
+        ])
+        self.assertEqual([r.name for r in results], ['/App/New', '/App/Existing'])
+        self.assertIsNone(results[0].error)
+        self.assertEqual(results[1].error.response['Error']['Code'], 'ParameterAlreadyExists')
+
+    def test_batch_put_rate(self):
+        start = time.time()
+        self.client.batch_put([{'Name': '/App/{}'.format(i), 'Type': 'String', 'Value': 'v'} for i in range(6)],
+                              concurrency=6, rate=10)
+        self.assertGreaterEqual(time.time() - start, 0.45)
+
+    def test_diff_and_delete_path(self):
+        for name in ['/App/A', '/App/B', '/App/C/D']:
+            self.put(name)
+        diff = self.client.diff_paths(['/App'], ['/App/A', '/App/E'])
+        self.assertEqual((diff.add, diff.overwrite, diff.remove), (['/App/E'], ['/App/A'], ['/App/B', '/App/C/D']))
+
+        self.assertEqual(self.client.delete_path('/App', keep=['/App/A']), ['/App/B', '/App/C/D'])
+        self.assertEqual(sorted(self.backend.ssm.parameters), ['/App/A'])
+
+    def test_versions(self):
+        for i in range(5):
+            self.put('/App/A', str(i), Overwrite=True)
+        versions = self.client.get_versions('/App/A', limit=2)
+        self.assertEqual([v['Value'] for v in versions], ['4', '3'])
+        versions = list(self.client.iter_versions('/App/A', min_version=2, limit=2))
+        self.assertEqual([v['Version'] for v in versions], [2, 3])
+
+    def test_describe_denied(self):
+        from ssm_ctl.fake import _error
+        def describe_parameters(**kwargs):
+            raise _error('AccessDeniedException', 'Not authorized', 'DescribeParameters')
+        self.backend.ssm.describe_parameters = describe_parameters
+        for i in range(3):
+            self.put('/App/{}'.format(i), str(i), Description='d')
+        self.put('/App/0', 'new', Overwrite=True, Description='d')
+
+        self.assertEqual(self.client.list_path('/App', use_snapshot=False)[0].name, '/App/0')
+        parameters = self.client.get(['/App/0', '/App/1'], full=True)
+        self.assertEqual([(p['Name'], p['Value'], p['Version'], p['Description']) for p in parameters],
+                         [('/App/0', 'new', 2, 'd'), ('/App/1', '1', 1, 'd')])
+        with self.assertRaises(KeyError):
+            self.client.get(['/App/Missing'], full=True)
+
+    def test_throttled_calls_are_retried(self):
+        import random
+        random.seed(0)
+        for i in range(30):
+            self.put('/App/{:02d}'.format(i))
+        self.backend.ssm.throttle_probability = 0.3
+        self.client._rate_limiter = AdaptiveRateLimiter(min_rate=1000)
+        self.assertEqual(len(self.client.get_path('/App', full=True)), 30)
+        self.assertGreater(self.client.rate_limiter().throttles, 0)
+
+class _Error(Exception):
+    def __init__(self, code, status):
+        super(_Error, self).__init__(code)
+        self.response = {'Error': {'Code': code}, 'ResponseMetadata': {'HTTPStatusCode': status}}
+
+class TestRetries(unittest.TestCase):
+    def client(self, errors):
+        class Client(object):
+            calls = 0
+            def describe_parameters(self, **kwargs):
+                Client.calls += 1
+                if errors:
+                    raise errors.pop(0)
+                return {'Parameters': []}
+        client = SSMClient()
+        client.CLIENT_FACTORY = lambda session, name: Client()
+        client.SESSION_FACTORY = lambda: None
+        client.MAX_BACKOFF = 0.001
+        return client, Client
+    
+    def test_transient_errors_are_retried(self):
+        client, stub = self.client([_Error('InternalServerError', 500), _Error('Unknown', 503)])
+        self.assertEqual(client._call('describe_parameters'), {'Parameters': []})
+        self.assertEqual(stub.calls, 3)
+        # Server errors don't slow down the request rate
+        self.assertEqual(client.rate_limiter().throttles, 0)
+    
+    def test_client_errors_are_raised(self):
+        client, stub = self.client([_Error('ValidationException', 400)])
+        with self.assertRaises(_Error):
+            client._call('describe_parameters')
+        self.assertEqual(stub.calls, 1)
+
+class TestHooks(unittest.TestCase):
+    def test_plain_functions_on_class(self):
+        backend = FakeBackend()
+        class Client(SSMClient):
+            pass
+        Client.SESSION_FACTORY = lambda: backend.session
+        Client.CLIENT_FACTORY = lambda session, name: session.client(name)
+        Client._ENCRYPTER = lambda plaintext, key_id: '[{}]{}'.format(key_id, plaintext)
+        Client._DECRYPTER = lambda c: c.upper()
+        client = Client()
+        self.assertIs(client._client(), backend.ssm)
+        self.assertEqual(client.encrypt('secret', 'key'), '[key]secret')
+        self.assertEqual(client.decrypt('secret'), 'SECRET')
+    
+    def test_defaults_are_bound(self):
+        client = SSMClient()
+        self.assertEqual(client._hook('SESSION_FACTORY').__self__, client)
+        self.assertEqual(client._hook('_DECRYPTER').__self__, client)
+
+class _Recorder(object):
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+class _StubKeyProvider(_Recorder):
+    def add_master_key(self, key_id):
+        self.kwargs.setdefault('key_ids', []).append(key_id)
+
+def _stub_encryption_sdk():
+    """A stand-in for aws_encryption_sdk that records the materials each call uses"""
+    sdk = types.ModuleType('aws_encryption_sdk')
+    sdk.calls = []
+    sdk.LocalCryptoMaterialsCache = _Recorder
+    sdk.KMSMasterKeyProvider = _StubKeyProvider
+    sdk.CachingCryptoMaterialsManager = _Recorder
+    def encrypt(source, **kwargs):
+        sdk.calls.append(('encrypt', kwargs))
+        return b'ciphertext:' + source.encode('utf-8'), None
+    def decrypt(source, **kwargs):
+        sdk.calls.append(('decrypt', kwargs))
+        return source[len(b'ciphertext:'):].decode('utf-8'), None
+    sdk.encrypt = encrypt
+    sdk.decrypt = decrypt
+    return sdk
+
+class TestDataKeyCache(unittest.TestCase):
+    def setUp(self):
+        self.sdk = _stub_encryption_sdk()
+        self._previous = sys.modules.get('aws_encryption_sdk')
+        sys.modules['aws_encryption_sdk'] = self.sdk
+        self.client = SSMClient()
+    
+    def tearDown(self):
+        if self._previous is None:
+            del sys.modules['aws_encryption_sdk']
+        else:
+            sys.modules['aws_encryption_sdk'] = self._previous
+    
+    def test_materials_manager_per_key(self):
+        self.client.set_data_key_cache(60, max_messages=10)
+        self.assertEqual(self.client.decrypt(self.client.encrypt('a', 'key1')), 'a')
+        self.client.encrypt('b', 'key1')
+        self.client.encrypt('c', 'key2')
+        
+        managers = [kwargs['materials_manager'] for _, kwargs in self.sdk.calls]
+        key1, decrypt, key1_again, key2 = managers
+        self.assertIs(key1, key1_again)
+        self.assertEqual(len(set(map(id, managers))), 3)
+        self.assertEqual(key1.kwargs['master_key_provider'].kwargs, {'key_ids': ['key1']})
+        self.assertEqual(key2.kwargs['master_key_provider'].kwargs, {'key_ids': ['key2']})
+        self.assertEqual(key1.kwargs['max_age'], 60.0)
+        self.assertEqual(key1.kwargs['max_messages_encrypted'], 10)
+        self.assertNotIn('max_bytes_encrypted', key1.kwargs)
+        # One LRU cache is shared by all the keys
+        self.assertIs(key1.kwargs['cache'], key2.kwargs['cache'])
+        self.assertEqual(key1.kwargs['cache'].args, (SSMClient.DATA_KEY_CACHE_CAPACITY,))
+    
+    def test_cache_off(self):
+        self.client.set_data_key_cache(60)
+        self.client.set_data_key_cache(None)
+        self.assertIsNone(self.client.get_materials_manager('key1'))
+        self.client.encrypt('a', 'key1')
+        (_, kwargs), = self.sdk.calls
+        self.assertEqual(list(kwargs), ['key_provider'])
+        self.assertEqual(kwargs['key_provider'].kwargs, {'key_ids': ['key1']})
+
+class TestDecryptCache(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = DecryptCache()
+        calls = []
+        def decrypt(ciphertext):
+            calls.append(ciphertext)
+            return ciphertext.upper()
+
+        for ciphertext in ['a', 'b', 'a', 'a']:
+            self.assertEqual(cache.get(ciphertext, decrypt), ciphertext.upper())
+        self.assertEqual(calls, ['a', 'b'])
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_bytes(self):
+        cache = DecryptCache()
+        self.assertEqual(cache.get(b'x', lambda c: b'secret'), b'secret')
+        self.assertEqual(cache.get(b'x', lambda c: b'other'), b'secret')
+
+    def test_concurrent_decrypts_wait(self):
+        cache = DecryptCache()
+        calls = []
+        def decrypt(ciphertext):
+            calls.append(ciphertext)
+            time.sleep(0.05)
+            return 'plaintext'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('a', decrypt))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['plaintext'] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_clear_zeroes(self):
+        cache = DecryptCache()
+        cache.get('a', lambda c: 'secret')
+        _, value = cache._entries[DecryptCache._digest('a')]
+        cache.clear()
+        self.assertEqual(value, bytearray(6))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get('a', lambda c: 'new'), 'new')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+from __future__ import absolute_import, print_function
+
+from .config import unittest
+
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+from six import StringIO
+
+from ssm_ctl.ssm import SSMClient
+from ssm_ctl.rate import AdaptiveRateLimiter
+from ssm_ctl.fake import FakeBackend
+from ssm_ctl import stats, cli
+
+class TestStats(unittest.TestCase):
+    def setUp(self):
+        self.stats = stats.Stats()
+        for seconds in [0.002, 0.002, 0.02, 0.2]:
+            self.stats.record('ssm', 'get_parameters', seconds, bytes_sent=10, bytes_received=100)
+        self.stats.record('ssm', 'put_parameter', 3.0, error=True, retries=2, throttles=2)
+
+    def test_histogram(self):
+        op = self.stats.operations[('ssm', 'get_parameters')]
+        self.assertEqual((op.calls, op.bytes_sent, op.bytes_received), (4, 40, 400))
+        self.assertEqual(op.quantile(0.5), 0.0025)
+        self.assertEqual(op.quantile(1.0), 0.2)
+        self.assertEqual(sum(op.buckets), 4)
+
+    def test_sizes(self):
+        request = {'Names': ['/App/A']}
+        response = {'Parameters': []}
+        collector = stats.Stats()
+        collector.record('ssm', 'get_parameters', 0.01, sent=request, received=response)
+        op = collector.operations[('ssm', 'get_parameters')]
+        self.assertEqual((op.bytes_sent, op.bytes_received), (stats.size_of(request), stats.size_of(response)))
+
+        collector = stats.Stats(sizes=False)
+        collector.record('ssm', 'get_parameters', 0.01, sent=request, received=response)
+        op = collector.operations[('ssm', 'get_parameters')]
+        self.assertEqual((op.calls, op.bytes_sent, op.bytes_received), (1, 0, 0))
+
+    def test_sinks(self):
+        output = StringIO()
+        stats.SummarySink(output).emit(self.stats)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith('ssm:get_parameters'))
+
+        lines = list(stats.StatsDSink(prefix='test').lines(self.stats))
+        self.assertIn('test.ssm.put_parameter.throttles:2|c', lines)
+
+        directory = tempfile.mkdtemp()
+        try:
+            file_name = os.path.join(directory, 'ssm_ctl.prom')
+            stats.PrometheusTextfileSink(file_name).emit(self.stats)
+            with open(file_name) as fp:
+                text = fp.read()
+            self.assertIn('ssm_ctl_retries_total{category="ssm",operation="put_parameter"} 2', text)
+            self.assertIn('ssm_ctl_latency_seconds_bucket{category="ssm",operation="get_parameters",le="+Inf"} 4', text)
+            self.assertEqual(os.listdir(directory), ['ssm_ctl.prom'])
+
+            file_name = os.path.join(directory, 'stats.json')
+            stats.JsonSink(file_name).emit(self.stats)
+            with open(file_name) as fp:
+                data = json.load(fp)
+            self.assertEqual([op['Operation'] for op in data['Operations']], ['get_parameters', 'put_parameter'])
+        finally:
+            shutil.rmtree(directory)
+
+class TestClientStats(unittest.TestCase):
+    def setUp(self):
+        self.backend = FakeBackend()
+        self.client = SSMClient()
+        self.backend.install(self.client)
+        SSMClient.STATS = stats.Stats()
+
+    def tearDown(self):
+        SSMClient.STATS = None
+
+    def test_calls_are_recorded(self):
+        random.seed(0)
+        for i in range(30):
+            self.backend.ssm.put_parameter(Name='/App/{:02d}'.format(i), Value='v', Type='String')
+        self.backend.ssm.throttle_probability = 0.3
+        self.client._rate_limiter = AdaptiveRateLimiter(min_rate=1000)
+        self.client.get_path('/App', full=True)
+        self.client.get_account()
+        self.client.decrypt(self.backend.kms.encrypt('secret', 'key'))
+
+        operations = SSMClient.STATS.operations
+        describe = operations[('ssm', 'describe_parameters')]
+        get = operations[('ssm', 'get_parameters')]
+        self.assertEqual(get.calls - get.errors, 3)
+        self.assertEqual(describe.throttles + get.throttles, self.client.rate_limiter().throttles)
+        self.assertGreater(describe.throttles + get.throttles, 0)
+        self.assertGreater(get.bytes_received, 0)
+        self.assertEqual(operations[('sts', 'get_caller_identity')].calls, 1)
+        self.assertEqual(operations[('crypto', 'decrypt')].bytes_received, len('secret'))
+
+    def test_report_crypto(self):
+        for value in ['a', 'b']:
+            self.client.encrypt(value, 'key')
+        with self.assertRaises(Exception):
+            self.client.decrypt('not a ciphertext')
+        self.assertEqual(SSMClient.STATS.operations[('crypto', 'encrypt')].calls, 2)
+
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            cli.report_crypto(self.client)
+            lines = sys.stderr.getvalue().splitlines()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('Decrypt calls: 1,'))
+        self.assertTrue(lines[0].endswith(', 1 failed'))
+        self.assertTrue(lines[1].startswith('Encrypt calls: 2,'))
+
+if __name__ == '__main__':
+    unittest.main()
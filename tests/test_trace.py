@@ -0,0 +1,55 @@
+from __future__ import absolute_import, print_function
+
+from .config import unittest
+
+import threading
+
+from ssm_ctl import trace
+from ssm_ctl.ssm import SSMClient
+from ssm_ctl.fake import FakeBackend
+
+class TestTrace(unittest.TestCase):
+    def tearDown(self):
+        trace.set_tracer(None)
+
+    def test_null_tracer(self):
+        with trace.span('a', x=1) as span:
+            self.assertIsNotNone(span)
+        self.assertFalse(hasattr(trace.get_tracer(), 'events'))
+
+    def test_chrome_tracer(self):
+        tracer = trace.ChromeTracer()
+        trace.set_tracer(tracer)
+        with trace.span('outer'):
+            with trace.span('inner', file='a.yaml'):
+                pass
+            thread = threading.Thread(target=lambda: trace.span('worker').__enter__().__exit__(None, None, None))
+            thread.start()
+            thread.join()
+        with self.assertRaises(ValueError):
+            with trace.span('failed'):
+                raise ValueError
+
+        data = tracer.dump()
+        events = dict((e['name'], e) for e in data['traceEvents'] if e['ph'] == 'X')
+        self.assertEqual(sorted(events), ['failed', 'inner', 'outer', 'worker'])
+        outer, inner = events['outer'], events['inner']
+        self.assertLessEqual(outer['ts'], inner['ts'])
+        self.assertGreaterEqual(outer['ts'] + outer['dur'], inner['ts'] + inner['dur'])
+        self.assertEqual(inner['args'], {'file': 'a.yaml'})
+        self.assertNotEqual(events['worker']['tid'], outer['tid'])
+        self.assertEqual(events['failed']['args'], {'error': 'ValueError'})
+        self.assertEqual(len([e for e in data['traceEvents'] if e['ph'] == 'M']), 2)
+
+    def test_batch_put_spans(self):
+        tracer = trace.ChromeTracer()
+        trace.set_tracer(tracer)
+        client = SSMClient()
+        FakeBackend().install(client)
+        client.batch_put([{'Name': '/App/{}'.format(i), 'Type': 'String', 'Value': 'v'} for i in range(5)])
+        names = [e['name'] for e in tracer.events]
+        self.assertEqual(names.count('put_parameter'), 5)
+        self.assertEqual(names.count('batch_put'), 1)
+
+if __name__ == '__main__':
+    unittest.main()
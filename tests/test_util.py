@@ -0,0 +1,39 @@
+from __future__ import absolute_import, print_function
+
+from .config import unittest
+
+from ssm_ctl.util import is_subpath, covering_paths, prefetch
+
+class TestPaths(unittest.TestCase):
+    def test_is_subpath(self):
+        self.assertTrue(is_subpath('/App', '/App'))
+        self.assertTrue(is_subpath('/App/Prod', '/App'))
+        self.assertTrue(is_subpath('/App/Prod', '/App/'))
+        self.assertFalse(is_subpath('/Application', '/App'))
+        self.assertTrue(is_subpath('/App', '/'))
+        self.assertTrue(is_subpath('/App', ''))
+
+    def test_covering_paths(self):
+        covers = covering_paths(['/App/Prod', '/App', '/Application', '/App/Prod/Db', '/Other'])
+        self.assertEqual(sorted(covers), ['/App', '/Application', '/Other'])
+
+    def test_covering_paths_root(self):
+        self.assertEqual(covering_paths(['/App', '', '/Other']), [''])
+
+class TestPrefetch(unittest.TestCase):
+    def test_order(self):
+        for depth in [0, 1, 3]:
+            self.assertEqual(list(prefetch(iter(range(20)), depth)), list(range(20)))
+
+    def test_error(self):
+        def items():
+            yield 1
+            raise ValueError('failed')
+        result = []
+        with self.assertRaises(ValueError):
+            for item in prefetch(items(), 2):
+                result.append(item)
+        self.assertEqual(result, [1])
+
+if __name__ == '__main__':
+    unittest.main()